@@ -0,0 +1,47 @@
+from functools import wraps
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from asgiref.sync import sync_to_async
+
+
+def conditional_page(validators_func):
+
+    """
+    Conditional GET decorator for async Django views.
+
+    Answers If-None-Match / If-Modified-Since with 304 Not Modified before the
+    view, or any cache lookup wrapped by it, runs. The view itself is expected
+    to send the same ETag and Last-Modified headers on its 200 responses.
+
+    Args:
+        validators_func (function): Returns a tuple of (etag, last modified
+            timestamp) for the requested resource, or None when it has no
+            stable validators yet. Called with the view's arguments.
+
+    Returns:
+        function: A decorator that applies conditional handling to a view function.
+
+    Example:
+        @conditional_page(validators_func=my_validators_func)
+        @custom_cache_page(timeout=3600, cache_key_func=my_cache_key_func)
+        async def my_view(request):
+            # Your view logic here
+
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        async def _wrapped_view(request, *args, **kwargs):
+            is_conditional = 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+            if request.method in ('GET', 'HEAD') and is_conditional:
+                validators = await sync_to_async(validators_func)(request, *args, **kwargs)
+                if validators:
+                    etag, last_modified = validators
+                    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                    if response is not None:
+                        response['ETag'] = etag
+                        response['Last-Modified'] = http_date(last_modified)
+                        return response
+
+            return await view_func(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
@@ -20,6 +20,8 @@ def custom_cache_page(timeout: int,
 
     Returns:
         function: A decorator that applies caching to a view function.
+            Responses carry an X-Cache header, HIT when served from the cache
+            and MISS when the view ran.
 
     Usage:
         Apply this decorator to a view function that needs caching.
@@ -44,7 +46,9 @@ def custom_cache_page(timeout: int,
             response = await sync_to_async(
                 cache.get)(cache_key) if cache_key else None
 
-            if response is None:
+            if response is not None:
+                response['X-Cache'] = 'HIT'
+            else:
                 response = await view_func(request, *args, **kwargs)
                 logging.error(f'response{response}')
                 if response.status_code in cache_status_codes:
@@ -57,6 +61,8 @@ def custom_cache_page(timeout: int,
                     else:
                         if cache_key:
                             await sync_to_async(cache.set)(cache_key, response, timeout)
+                # Set after storing, so only the served copy says MISS.
+                response['X-Cache'] = 'MISS'
             return response
         return _wrapped_view
     return decorator
@@ -16,3 +16,5 @@ class ErrorCodes(Enum):
     METHOD_NOT_ALLOWED = "PO405"
     GATEWAY_TIMEOUT = 'PO205'
     LARGE_STRING = "P0413"
+    ANALYSIS_QUEUE_FULL = 'PO429'
+    ANALYSIS_QUEUE_TIMEOUT = 'PO503'
@@ -0,0 +1,127 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from rest_framework import status
+
+from exceptions.service_error import ServiceException
+from exceptions.error_codes import ErrorCodes
+from utils.metrics import metrics
+from .core import estimate_analysis_memory
+
+
+class AdmissionController:
+
+    """
+    Bound the analyses running in a worker by count and by estimated memory.
+
+    An analysis that does not fit waits in a bounded queue. When the queue is
+    full it is rejected with 429, when it waits longer than `queue_timeout`
+    seconds with 503, both carrying a retry_after hint in rest_obj.
+    A single analysis bigger than the whole budget is admitted once nothing
+    else is running.
+
+    Usage:
+        async with get_admission_controller().admit(len(text)):
+            # run the analysis
+    """
+
+    def __init__(self, max_concurrency: int, memory_budget: int, max_queue: int,
+                 queue_timeout: float, retry_after: int):
+        self.max_concurrency = max_concurrency
+        self.memory_budget = memory_budget
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.running = 0
+        self.memory_in_use = 0
+        self.waiting = 0
+        self._condition = None
+        self._loop = None
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        # asyncio primitives belong to one event loop, each worker runs one.
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._loop is not loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+        return self._condition
+
+    def fits(self, cost: int) -> bool:
+        return self.running < self.max_concurrency and self.memory_in_use + cost <= self.memory_budget
+
+    @asynccontextmanager
+    async def admit(self, text_length: int):
+        cost = min(estimate_analysis_memory(text_length), self.memory_budget)
+        await self.acquire(cost)
+        try:
+            yield
+        finally:
+            await self.release(cost)
+
+    async def acquire(self, cost: int) -> None:
+        condition = self.condition
+        async with condition:
+            if not (self.waiting == 0 and self.fits(cost)):
+                if self.waiting >= self.max_queue:
+                    metrics.incr('admission.rejected_queue_full')
+                    raise ServiceException(
+                        status.HTTP_429_TOO_MANY_REQUESTS, ErrorCodes.ANALYSIS_QUEUE_FULL,
+                        'Too many analyses in progress', {'retry_after': self.retry_after})
+
+                started = time.monotonic()
+                self.waiting += 1
+                metrics.gauge('admission.queue_depth', self.waiting)
+                try:
+                    await asyncio.wait_for(condition.wait_for(lambda: self.fits(cost)), self.queue_timeout)
+                except asyncio.TimeoutError:
+                    metrics.incr('admission.rejected_timeout')
+                    raise ServiceException(
+                        status.HTTP_503_SERVICE_UNAVAILABLE, ErrorCodes.ANALYSIS_QUEUE_TIMEOUT,
+                        'Analysis capacity exhausted, try again later', {'retry_after': self.retry_after})
+                finally:
+                    self.waiting -= 1
+                    metrics.gauge('admission.queue_depth', self.waiting)
+                    metrics.observe('admission.wait_ms', (time.monotonic() - started) * 1000)
+
+            self.running += 1
+            self.memory_in_use += cost
+            metrics.incr('admission.admitted')
+            self.report()
+
+    async def release(self, cost: int) -> None:
+        condition = self.condition
+        async with condition:
+            self.running -= 1
+            self.memory_in_use -= cost
+            self.report()
+            condition.notify_all()
+
+    def report(self) -> None:
+        metrics.gauge('admission.running', self.running)
+        metrics.gauge('admission.memory_in_use_bytes', self.memory_in_use)
+
+
+_admission_controller = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """
+    Return the worker wide admission controller, creating it on first use.
+
+    ANALYSIS_MAX_CONCURRENCY and ANALYSIS_MEMORY_BUDGET_BYTES are limits of
+    the whole host, every one of the WEB_CONCURRENCY workers gets an even share
+    and can always run at least one analysis.
+    """
+    global _admission_controller
+    if _admission_controller is None:
+        workers = max(1, settings.WEB_CONCURRENCY)
+        _admission_controller = AdmissionController(
+            max(1, settings.ANALYSIS_MAX_CONCURRENCY // workers),
+            settings.ANALYSIS_MEMORY_BUDGET_BYTES // workers,
+            settings.ANALYSIS_QUEUE_SIZE,
+            settings.ANALYSIS_QUEUE_TIMEOUT,
+            settings.ANALYSIS_RETRY_AFTER)
+    return _admission_controller
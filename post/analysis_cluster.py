@@ -0,0 +1,166 @@
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import CancelledError
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from utils.metrics import metrics
+
+# distributed is imported lazily, like dask in analysis_pool.
+
+_client = None
+_cluster = None
+_client_lock = threading.Lock()
+_unreachable_until = 0.0
+
+
+def distributed_backend_enabled() -> bool:
+    return settings.ANALYSIS_BACKEND == 'distributed'
+
+
+def cluster_errors() -> tuple:
+    """
+    :return: Exception types meaning the cluster could not run an analysis,
+        callers fall back to the local analysis pool on them. Errors raised
+        by the analysis itself are not part of them.
+    """
+    from distributed import KilledWorker
+    from distributed.comm import CommClosedError
+
+    return OSError, TimeoutError, CancelledError, KilledWorker, CommClosedError
+
+
+def start_local_cluster():
+    """
+    Start a LocalCluster of analysis workers scaled between DASK_MIN_WORKERS
+    and DASK_MAX_WORKERS, for development and tests.
+    """
+    from distributed import LocalCluster
+
+    cluster = LocalCluster(
+        n_workers=settings.DASK_MIN_WORKERS, threads_per_worker=1, processes=True,
+        dashboard_address=None, preload=['post_analyzer.dask_preload'])
+    cluster.adapt(minimum=settings.DASK_MIN_WORKERS, maximum=settings.DASK_MAX_WORKERS)
+    return cluster
+
+
+def get_distributed_client():
+    """
+    Return the client of the analysis cluster, connecting on first use.
+
+    Connects to the scheduler at DASK_SCHEDULER_ADDRESS, or starts a
+    LocalCluster when no address is configured.
+
+    :return: The client, or None when the scheduler cannot be reached. No new
+        connection is attempted for DASK_RECONNECT_INTERVAL seconds after a
+        failure, callers fall back to the local analysis pool meanwhile.
+    """
+    global _client, _cluster, _unreachable_until
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is not None or time.monotonic() < _unreachable_until:
+            return _client
+
+        try:
+            from distributed import Client
+
+            if settings.DASK_SCHEDULER_ADDRESS:
+                _client = Client(settings.DASK_SCHEDULER_ADDRESS, timeout=settings.DASK_CONNECT_TIMEOUT,
+                                 set_as_default=False)
+            else:
+                _cluster = _cluster or start_local_cluster()
+                _client = Client(_cluster, set_as_default=False)
+            logging.info(f'Connected to analysis cluster {_client.scheduler.address}')
+
+        except cluster_errors() as e:
+            _unreachable_until = time.monotonic() + settings.DASK_RECONNECT_INTERVAL
+            metrics.incr('analysis_cluster.connect_failed')
+            logging.error(f'Analysis cluster is not reachable, analysing locally: {str(e)}')
+
+    return _client
+
+
+def warm_cluster_worker() -> None:
+    """
+    Import the analysis code on a cluster worker before its first task.
+    """
+    from . import core  # noqa: F401
+
+
+def warm_analysis_cluster():
+    """
+    Connect to the analysis cluster and import the analysis code on every worker.
+
+    :return: Number of cluster workers, or None when the cluster is not
+        usable and the local pool has to be warmed instead.
+    """
+    client = get_distributed_client()
+    if client is None:
+        return None
+    try:
+        client.wait_for_workers(1, timeout=settings.DASK_CONNECT_TIMEOUT)
+        client.run(warm_cluster_worker)
+        return len(client.scheduler_info()['workers'])
+
+    except cluster_errors() as e:
+        logging.error(f'Analysis cluster has no usable workers: {str(e)}')
+        return None
+
+
+def resolve(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+async def analyze_on_cluster(client, text_parts: list) -> dict:
+    """
+    Analyze text parts as one task each on the cluster and aggregate them there.
+
+    The tasks are submitted without blocking and the request awaits their
+    completion on the event loop, no thread is held meanwhile. Spreading the
+    parts over separate tasks lets the scheduler steal them from busy workers,
+    so one large post uses the cores of every node.
+
+    :param client: Client returned by get_distributed_client.
+    :param text_parts: Text parts, see core.divide_text.
+    :return: Dictionary containing aggregated metrics.
+    :raises: One of cluster_errors() if the cluster loses the connection, a
+        worker or the tasks, or the analysis takes longer than DASK_ANALYSIS_TIMEOUT.
+    """
+    from .core import analyze_text, process_subtext_results
+
+    part_futures = client.map(analyze_text, text_parts, pure=False)
+    result = client.submit(process_subtext_results, part_futures, pure=False)
+
+    loop = asyncio.get_running_loop()
+    waiter = loop.create_future()
+    result.add_done_callback(lambda _: loop.call_soon_threadsafe(resolve, waiter))
+    try:
+        await asyncio.wait_for(waiter, settings.DASK_ANALYSIS_TIMEOUT)
+    except asyncio.TimeoutError:
+        # The client's blocking calls talk to the scheduler, keep them off the event loop.
+        await sync_to_async(client.cancel, thread_sensitive=False)(part_futures + [result])
+        raise
+    # Fetches the aggregate from the worker holding it.
+    return await sync_to_async(result.result, thread_sensitive=False)()
+
+
+def shutdown_analysis_cluster() -> None:
+    """
+    Close the cluster client, and the LocalCluster when this process started one.
+    """
+    global _client, _cluster
+    with _client_lock:
+        client, cluster = _client, _cluster
+        _client = _cluster = None
+    for resource in (client, cluster):
+        if resource is not None:
+            try:
+                resource.close()
+            except Exception as e:
+                logging.error(f'Unable to close analysis cluster: {str(e)}')
@@ -0,0 +1,191 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from utils.metrics import metrics
+from .core import analyze_text, process_subtext_results
+from .analysis_cluster import (
+    analyze_on_cluster,
+    cluster_errors,
+    distributed_backend_enabled,
+    get_distributed_client,
+    shutdown_analysis_cluster,
+    warm_analysis_cluster
+)
+
+# dask is imported lazily, loading it costs more than the rest of post.views.
+
+# Text parts queued per analysis pool process while a text is being divided
+PARTS_IN_FLIGHT_PER_WORKER = 2
+
+_analysis_pool = None
+_analysis_pool_lock = threading.Lock()
+_warm_state = {'warm': False, 'warming': False, 'workers': 0, 'warmup_seconds': None}
+
+
+def initialize_analysis_worker() -> None:
+    """
+    Import everything an analysis task needs when a pool process starts,
+    instead of on the first task it runs.
+    """
+    import dask.multiprocessing  # noqa: F401
+    from . import core  # noqa: F401
+
+
+def warm_analysis_worker(barrier, timeout: float) -> int:
+    """
+    Warm up task, waits until every pool process runs one.
+
+    The pool hands queued tasks to idle processes, so without the barrier
+    one fast process could run all of them while the others never start.
+
+    :param barrier: Manager barrier with one party per pool process.
+    :return: Pid of the process that ran the task.
+    """
+    barrier.wait(timeout)
+    return os.getpid()
+
+
+def get_analysis_pool() -> ProcessPoolExecutor:
+    """
+    Return the process pool running text analysis, creating it on first use.
+
+    Without a long lived pool every analysis would start and tear down its
+    own worker processes.
+    """
+    global _analysis_pool
+    if _analysis_pool is None:
+        with _analysis_pool_lock:
+            if _analysis_pool is None:
+                import dask.multiprocessing
+
+                _analysis_pool = ProcessPoolExecutor(
+                    max_workers=settings.ANALYSIS_POOL_WORKERS,
+                    mp_context=dask.multiprocessing.get_context(),
+                    initializer=initialize_analysis_worker)
+                logging.info(f'Started analysis pool with {_analysis_pool._max_workers} workers')
+    return _analysis_pool
+
+
+def warm_analysis_pool() -> None:
+    """
+    Start every pool process and wait until each one has run a task, or
+    connect to the analysis cluster with the distributed backend.
+
+    Safe to call concurrently and repeatedly, only the first call warms.
+    """
+    with _analysis_pool_lock:
+        if _warm_state['warm'] or _warm_state['warming']:
+            return
+        _warm_state['warming'] = True
+
+    started = time.monotonic()
+    try:
+        workers = warm_analysis_cluster() if distributed_backend_enabled() else None
+        if workers is None:
+            import dask.multiprocessing
+
+            pool = get_analysis_pool()
+            timeout = settings.ANALYSIS_POOL_WARMUP_TIMEOUT
+            with dask.multiprocessing.get_context().Manager() as manager:
+                barrier = manager.Barrier(pool._max_workers)
+                futures = [pool.submit(warm_analysis_worker, barrier, timeout) for _ in range(pool._max_workers)]
+                workers = len({future.result(timeout) for future in futures})
+        _warm_state.update(warm=True, workers=workers,
+                           warmup_seconds=round(time.monotonic() - started, 3))
+        metrics.observe('analysis_pool.warmup_seconds', _warm_state['warmup_seconds'])
+        logging.info(f'Analysis pool warmed in {_warm_state["warmup_seconds"]}s')
+
+    except Exception as e:
+        logging.error(f'Analysis pool warm up failed: {str(e)}')
+
+    finally:
+        _warm_state['warming'] = False
+
+
+def start_warming_analysis_pool() -> None:
+    """
+    Warm the analysis pool in a background thread.
+    """
+    threading.Thread(target=warm_analysis_pool, name='analysis-pool-warmup', daemon=True).start()
+
+
+def analysis_pool_status() -> dict:
+    return dict(_warm_state)
+
+
+def shutdown_analysis_pool(wait: bool = True) -> None:
+    """
+    Shut the analysis pool down, waiting for running analyses when wait is True,
+    and disconnect from the analysis cluster.
+    """
+    global _analysis_pool
+    with _analysis_pool_lock:
+        pool, _analysis_pool = _analysis_pool, None
+        _warm_state.update(warm=False, workers=0)
+    if pool is not None:
+        pool.shutdown(wait=wait)
+    shutdown_analysis_cluster()
+
+
+def analyze_text_parts(text_parts) -> dict:
+    """
+    Analyze text parts in parallel on the analysis pool and aggregate the results.
+
+    Parts are submitted as they are produced, with at most
+    PARTS_IN_FLIGHT_PER_WORKER queued per pool process, so a text divided
+    lazily while it is decompressed is never held whole.
+    This call blocks until every part is analyzed, run it off the event loop.
+
+    :param text_parts: Iterable of text parts, see core.divide_text.
+    :return: Dictionary containing aggregated metrics.
+    """
+    pool = get_analysis_pool()
+    max_in_flight = pool._max_workers * PARTS_IN_FLIGHT_PER_WORKER
+    results, in_flight = [], set()
+    try:
+        for part in text_parts:
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                results.extend(future.result() for future in done)
+            in_flight.add(pool.submit(analyze_text, part))
+        results.extend(future.result() for future in wait(in_flight).done)
+    finally:
+        # Parts still queued after a failure are not worth analysing.
+        for future in in_flight:
+            future.cancel()
+    return process_subtext_results(results)
+
+
+async def analyze_text_parts_async(text_parts) -> dict:
+    """
+    Analyze text parts on the configured ANALYSIS_BACKEND without blocking the event loop.
+
+    With the distributed backend the parts run on the dask cluster, see
+    analysis_cluster.analyze_on_cluster. When the cluster is unreachable or
+    fails the analysis, see analysis_cluster.cluster_errors, the analysis
+    runs on the local pool instead.
+
+    The parts are produced in a worker thread, a lazy iterable is only
+    consumed there and never on the event loop.
+
+    :param text_parts: Iterable of text parts, see core.divide_text.
+    :return: Dictionary containing aggregated metrics.
+    """
+    if distributed_backend_enabled():
+        client = await sync_to_async(get_distributed_client, thread_sensitive=False)()
+        # Kept for the local pool in case the cluster fails.
+        text_parts = await sync_to_async(list, thread_sensitive=False)(text_parts)
+        if client is not None:
+            try:
+                return await analyze_on_cluster(client, text_parts)
+            except cluster_errors() as e:
+                logging.error(f'Cluster analysis failed, analysing locally: {str(e)}')
+        metrics.incr('analysis_cluster.fallback')
+
+    return await sync_to_async(analyze_text_parts, thread_sensitive=False)(text_parts)
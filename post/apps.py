@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class PostConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'post'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Serving processes start the analysis pool before the first request
+        # needs it, management commands and pool workers leave it alone.
+        if settings.ANALYSIS_POOL_PREWARM:
+            from .analysis_pool import start_warming_analysis_pool
+            start_warming_analysis_pool()
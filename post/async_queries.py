@@ -1,10 +1,15 @@
 import asyncio
 import logging
-import datetime
 from asgiref.sync import sync_to_async
 from rest_framework import status
 
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.http import parse_http_date_safe
+
 from django.db import (
+    connections,
     OperationalError,
     DatabaseError,
     DataError,
@@ -19,9 +24,19 @@ from django.core.exceptions import (
     MultipleObjectsReturned)
 
 from decorators.retry import async_retry_and_timeout
+from post_analyzer.db_router import pin_post_to_primary, read_database_for_post
 from exceptions.service_error import ServiceException
 from exceptions.error_codes import ErrorCodes
+from utils.caching_functions import (
+    analysis_cache_key,
+    analysis_etag,
+    cache_analysis_response,
+    invalidate_post_analysis
+)
+from .fields import stored_value
 from .models import Post
+from .stats import read_corpus_stats, record_analyses
+from .write_behind import get_write_behind
 
 
 @async_retry_and_timeout(retries=1, wait_time=2000, timeout=4)
@@ -37,7 +52,8 @@ def get_post_async(post_id: str) -> Post:
         ObjectDoesNotExist: If the post with the specified UUID does not exist.
     """
     try:
-        post = Post.objects.get(uuid=post_id)
+        # The text is only needed by a cold analysis, see get_stored_post_text_async.
+        post = Post.objects.using(read_database_for_post(post_id)).defer('post_description').get(uuid=post_id)
         return post
 
     except ObjectDoesNotExist:
@@ -53,6 +69,30 @@ def get_post_async(post_id: str) -> Post:
             status.HTTP_500_INTERNAL_SERVER_ERROR, ErrorCodes.INTERNAL_SERVER_ERROR, 'Unabe to query DB')
 
 
+@async_retry_and_timeout(retries=1, wait_time=2000, timeout=4)
+@sync_to_async
+def get_stored_post_text_async(post_id: str):
+    """
+    Asynchronously retrieve the stored, still compressed, text of a post.
+
+    :param post_id: The UUID of the post.
+    :return: Bytes to read with utils.compression.iter_stored_text, None when the post has no text.
+    :raises ServiceException: If the post does not exist or the DB can not be queried.
+    """
+    try:
+        stored = Post.objects.using(read_database_for_post(post_id)).values_list(
+            stored_value('post_description'), flat=True).get(uuid=post_id)
+        return bytes(stored) if stored is not None else None
+
+    except ObjectDoesNotExist:
+        raise ServiceException(
+            status.HTTP_404_NOT_FOUND, ErrorCodes.POST_NOT_FOUND, f'Post does not exist {post_id}')
+
+    except (OperationalError, DatabaseError, InternalError):
+        raise ServiceException(
+            status.HTTP_500_INTERNAL_SERVER_ERROR, ErrorCodes.INTERNAL_SERVER_ERROR, 'Unabe to query DB')
+
+
 @async_retry_and_timeout(retries=1, wait_time=2000, timeout=4)
 @sync_to_async
 def post_exists_async(post_id: str) -> Post:
@@ -66,7 +106,8 @@ def post_exists_async(post_id: str) -> Post:
         ObjectDoesNotExist: If the post with the specified UUID does not exist.
     """
     try:
-        post = Post.objects.filter(uuid=post_id).first()
+        # Only the existence matters, the text is not read or decompressed.
+        post = Post.objects.using(read_database_for_post(post_id)).defer('post_description').filter(uuid=post_id).first()
         return post
 
     except (OperationalError, DatabaseError, InternalError):
@@ -74,6 +115,88 @@ def post_exists_async(post_id: str) -> Post:
             status.HTTP_500_INTERNAL_SERVER_ERROR, ErrorCodes.INTERNAL_SERVER_ERROR, 'Unable to query DB')
 
 
+def analysis_validators_function(request, *args: list, **kwargs: dict):
+    """
+    Resolve the ETag and Last-Modified of a post analysis for conditional GETs.
+
+    The cached analysis response is checked first, then a projected read of
+    uuid and analysed_at, so neither post_description nor the response body
+    is loaded.
+
+    Returns:
+        tuple: (etag, last modified timestamp), or None while the post is not analysed.
+    """
+    post_id = kwargs.get('post_id')
+    response = cache.get(analysis_cache_key(post_id))
+    if response is not None and response.has_header('ETag'):
+        return response['ETag'], parse_http_date_safe(response['Last-Modified'])
+
+    try:
+        row = Post.objects.using(read_database_for_post(post_id)).filter(
+            uuid=post_id, is_analysed=True).values_list('uuid', 'analysed_at').first()
+    except (ValidationError, OperationalError, DatabaseError, InternalError):
+        return None
+
+    if row is None:
+        return None
+    uuid, analysed_at = row
+    return analysis_etag(uuid, analysed_at), int(analysed_at.timestamp())
+
+
+@async_retry_and_timeout(retries=1, wait_time=2000, timeout=4)
+@sync_to_async
+def list_posts_async(filters: dict, after: tuple, limit: int) -> list:
+    """
+    Asynchronously list one page of posts in (created_at, id) order.
+
+    The page starts right after the `after` keyset and is read from the
+    supporting indexes with a range seek, so its cost depends on `limit`
+    only and not on how deep into the listing the cursor points.
+    analysed_at ranges are read from post_analysed_at_idx and sorted
+    instead, their pages cost grows with the number of posts in the range.
+    Only the metric columns are selected, never post_description.
+    Args:
+        filters (dict): Field lookups, e.g. is_analysed or analysed_at__gte.
+        after (tuple): (created_at, id) of the last post of the previous page, or None.
+        limit (int): Maximum number of posts to return.
+    Returns:
+        list: Dicts of the selected columns.
+    """
+    try:
+        queryset = Post.objects.filter(**filters)
+        if after is not None:
+            created_at, pk = after
+            ops = connections[queryset.db].ops
+            columns = ', '.join(f'{ops.quote_name(Post._meta.db_table)}.{ops.quote_name(column)}'
+                                for column in ('created_at', 'id'))
+            # A row value comparison is one range seek on the (created_at, id)
+            # indexes, the equivalent OR of two predicates scans them from the start.
+            queryset = queryset.extra(
+                where=[f'({columns}) > (%s, %s)'], params=[ops.adapt_datetimefield_value(created_at), pk])
+        return list(queryset.order_by('created_at', 'id').values(
+            'id', 'uuid', 'created_at', 'is_analysed', 'analysed_at', 'total_words', 'average_word_length')[:limit])
+
+    except (OperationalError, DatabaseError, InternalError):
+        raise ServiceException(
+            status.HTTP_500_INTERNAL_SERVER_ERROR, ErrorCodes.INTERNAL_SERVER_ERROR, 'Unable to query DB')
+
+
+@async_retry_and_timeout(retries=1, wait_time=2000, timeout=4)
+@sync_to_async
+def corpus_stats_async() -> dict:
+    """
+    Asynchronously read the incrementally maintained corpus statistics.
+    Returns:
+        dict: Post counts, backlog size, total words and average word length.
+    """
+    try:
+        return read_corpus_stats()
+
+    except (OperationalError, DatabaseError, InternalError):
+        raise ServiceException(
+            status.HTTP_500_INTERNAL_SERVER_ERROR, ErrorCodes.INTERNAL_SERVER_ERROR, 'Unable to query DB')
+
+
 @async_retry_and_timeout(retries=1, wait_time=2000, timeout=4)
 @sync_to_async
 def post_create_async(post_data: dict) -> Post:
@@ -89,10 +212,14 @@ def post_create_async(post_data: dict) -> Post:
     try:
         with transaction.atomic():
             post = Post.objects.create(**post_data)
-            return post
+        pin_post_to_primary(post.uuid)
+        return post
 
     except IntegrityError:
-        raise ServiceException(status.HTTP_409_CONFLICT, ErrorCodes.RESOURCE_DUPLICATION_ATTEMPTED, f'Attempting Duplicate Post ID{post_data}')
+        # A concurrent create of the same uuid, or a duplicate the uuid filter
+        # let skip the existence query.
+        raise ServiceException(status.HTTP_409_CONFLICT, ErrorCodes.RESOURCE_DUPLICATION,
+                               f'Unique Id {post_data.get("uuid")} already Exist in the system')
 
     except (OperationalError, DatabaseError, InternalError):
         raise ServiceException(
@@ -101,11 +228,32 @@ def post_create_async(post_data: dict) -> Post:
 
 @async_retry_and_timeout(retries=1, wait_time=2000, timeout=4)
 @sync_to_async
-def update_post_sync(post_id, analyzed_data):
+def update_post_sync(post_id, analyzed_data, response=None, analysed_at=None):
+    """
+    Write an analysis result to the post row and refresh its cached analysis.
+    The corpus statistics are updated in the same transaction.
+    Args:
+        post_id (str): The UUID of the post.
+        analyzed_data (dict): Metrics produced by the analysis.
+        response: The analysis response, cached as soon as the row is written.
+            Without it the cached analysis is dropped instead.
+        analysed_at (datetime, optional): When the analysis finished, defaults to now.
+    Returns:
+        int: Number of updated rows.
+    """
     try:
-        update_dict = dict(is_analysed=True, analysed_at=datetime.datetime.now())
+        update_dict = dict(is_analysed=True, analysed_at=analysed_at or timezone.now())
         update_dict.update(analyzed_data)
-        updated = Post.objects.filter(uuid=post_id).update(**update_dict)
+        with transaction.atomic():
+            previous = list(Post.objects.select_for_update().filter(uuid=post_id).values_list(
+                'is_analysed', 'total_words', 'average_word_length'))
+            updated = Post.objects.filter(uuid=post_id).update(**update_dict)
+            record_analyses(previous, [analyzed_data] * updated)
+        pin_post_to_primary(post_id)
+        if response is not None:
+            cache_analysis_response(post_id, response)
+        else:
+            invalidate_post_analysis(post_id)
         return updated
 
     except (OperationalError, DatabaseError, InternalError) as e:
@@ -115,6 +263,28 @@ def update_post_sync(post_id, analyzed_data):
         raise ServiceException(status.HTTP_400_BAD_REQUEST, ErrorCodes.POST_UPDATION_ERROR, 'Unexpected analysis data')
 
 
+async def save_post_analysis(post_id, analyzed_data, response, analysed_at):
+    """
+    Persist an analysis result and make it readable straight away.
+
+    With ANALYSIS_WRITE_BEHIND enabled the response is cached first and the
+    row update is handed to the write-behind writer, otherwise, or when the
+    writer is saturated, update_post_sync writes the row and caches it.
+
+    :param post_id: The UUID of the post.
+    :param analyzed_data: Metrics produced by the analysis.
+    :param response: The analysis response sent to the client.
+    :param analysed_at: When the analysis finished, the response validators use it.
+    """
+    if settings.ANALYSIS_WRITE_BEHIND:
+        await sync_to_async(cache_analysis_response)(post_id, response)
+        await sync_to_async(pin_post_to_primary)(post_id)
+        if get_write_behind().enqueue(post_id, analyzed_data, analysed_at):
+            return
+
+    await update_post_sync(post_id, analyzed_data, response, analysed_at)
+
+
 async def retry_update_post(post_id, analyzed_data,
                             max_retries=3, base_retry_interval=1):
     for attempt in range(max_retries + 1):  # Include the initial attempt
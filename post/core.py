@@ -4,6 +4,8 @@ from rest_framework import status
 from functools import reduce
 from django.conf import settings
 
+from utils.compression import iter_stored_text, stored_text_length
+
 
 def calculate_parts(text_length,
                     cutoff_parts=settings.CUTOFF_PARTS,
@@ -53,6 +55,20 @@ def calculate_parts(text_length,
     return cutoff_parts
 
 
+def estimate_analysis_memory(text_length: int) -> int:
+    """
+    Estimate the peak memory, in bytes, of analyzing a text of the given length.
+
+    :param text_length: Number of characters in the text.
+    :return: Estimated bytes, ANALYSIS_MEMORY_PER_CHAR for every character (the
+        text, its parts and their pickled copies sent to the pool) plus
+        ANALYSIS_MEMORY_PER_PART for every part analyzed in a pool worker.
+    :raises ServiceException: If the text is too big to analyze.
+    """
+    number_of_parts = calculate_parts(text_length)
+    return text_length * settings.ANALYSIS_MEMORY_PER_CHAR + number_of_parts * settings.ANALYSIS_MEMORY_PER_PART
+
+
 def find_text_split(text: str, text_length: int) -> int:
     """
     Find the optimal split point for dividing a text into parts.
@@ -79,17 +95,49 @@ def divide_text(text: str):
     :param number_of_parts: Number of parts to divide the text into.
     :yield: Generator yielding text parts.
     """
-    remaining_text = text
-    total_length = len(text)
+    yield from divide_text_chunks(iter((text,)), len(text))
+
+
+def divide_text_chunks(chunks, total_length: int):
+    """
+    Divide a text read piece by piece into the same parts as divide_text.
+
+    Only the part being cut is buffered, so a stored text can be divided
+    while it is decompressed without ever holding it whole.
+
+    :param chunks: Iterator of consecutive pieces of the text, see utils.compression.iter_stored_text.
+    :param total_length: Length of the whole text.
+    :yield: Generator yielding text parts.
+    """
+    buffer = ''
+
+    def fill(length: int) -> str:
+        pieces = [buffer]
+        buffered = len(buffer)
+        while buffered < length:
+            piece = next(chunks, None)
+            if piece is None:
+                break
+            pieces.append(piece)
+            buffered += len(piece)
+        return ''.join(pieces)
+
     number_of_parts = calculate_parts(total_length)
     part_length = (total_length // number_of_parts)
 
     for _ in range(number_of_parts - 1):
-        split_point = find_text_split(remaining_text, part_length)
+        buffer = fill(part_length + 1)
+        split_point = find_text_split(buffer, part_length)
         if split_point > 0:
-            yield remaining_text[:split_point].rstrip()
-            remaining_text = remaining_text[split_point:].lstrip()
-
+            yield buffer[:split_point].rstrip()
+            buffer = buffer[split_point:].lstrip()
+            while not buffer:
+                piece = next(chunks, None)
+                if piece is None:
+                    break
+                buffer = piece.lstrip()
+
+    remaining_text = fill(total_length)
     if remaining_text:
         yield remaining_text
 
@@ -151,3 +199,16 @@ def process_subtext_results(subtext_results: list, **kwargs: dict):
         }
     except Exception as e:
         raise ServiceException(500, ErrorCodes.INTERNAL_SERVER_ERROR, "Error during subtext processing", {'error': str(e)})
+
+
+def analyze_stored_post_text(stored, **kwargs: dict):
+    """
+    Analyze a stored post text, see fields.CompressedTextField, decompressing it part by part.
+
+    :param stored: Stored bytes of the text.
+    :param kwargs: Additional keyword arguments.
+    :return: Dictionary containing aggregated metrics.
+    :raises ServiceException: If the text is too big or the analysis fails.
+    """
+    text_parts = divide_text_chunks(iter_stored_text(stored), stored_text_length(stored))
+    return process_subtext_results([analyze_text(part) for part in text_parts])
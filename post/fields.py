@@ -0,0 +1,50 @@
+from django import forms
+from django.conf import settings
+from django.db import models
+from django.db.models.functions import Cast
+
+from utils.compression import compress_text, decompress_text
+
+
+class CompressedTextField(models.BinaryField):
+    """
+    Text column stored compressed in a binary column, see utils.compression.
+
+    Reads and writes str like a TextField. Texts are compressed with
+    POST_TEXT_COMPRESSION once they reach POST_TEXT_COMPRESSION_THRESHOLD
+    bytes, the codec is recorded per value so changing it only affects new writes.
+    Use stored_value() to read the stored bytes without decompressing them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', True)
+        super().__init__(*args, **kwargs)
+
+    def get_prep_value(self, value):
+        if isinstance(value, str):
+            return compress_text(value, settings.POST_TEXT_COMPRESSION, settings.POST_TEXT_COMPRESSION_THRESHOLD)
+        return super().get_prep_value(value)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return decompress_text(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        return decompress_text(value)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{'widget': forms.Textarea, **kwargs})
+
+
+def stored_value(field_name: str) -> Cast:
+    """
+    Expression selecting the stored bytes of a CompressedTextField, to stream
+    them with utils.compression.iter_stored_text.
+    """
+    return Cast(field_name, output_field=models.BinaryField())
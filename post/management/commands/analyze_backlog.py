@@ -0,0 +1,186 @@
+import json
+import time
+import logging
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from exceptions.service_error import ServiceException
+from utils.common import validate_analyzed_data_response
+from utils.caching_functions import invalidate_post_analysis
+from utils.compression import stored_text_length
+from post.core import analyze_stored_post_text
+from post.analysis_cluster import get_distributed_client, shutdown_analysis_cluster
+from post.fields import stored_value
+from post.models import Post
+from post.stats import record_analyses
+from post.notifier import notify_analysis_written
+
+
+def analyze_backlog_item(item: tuple) -> tuple:
+    """
+    Analyze a single backlog post inside a pool worker.
+
+    :param item: Tuple of (post pk, stored post text), the text is decompressed in the worker.
+    :return: Tuple of (post pk, analyzed data or None, error message or None).
+    """
+    pk, stored = item
+    try:
+        analyzed_data = analyze_stored_post_text(stored or '')
+        if not validate_analyzed_data_response(analyzed_data):
+            return pk, None, 'Unexpected analysis data'
+        return pk, analyzed_data, None
+
+    except ServiceException as e:
+        return pk, None, e.message
+
+    except Exception as e:
+        return pk, None, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Analyze all unanalysed posts in bulk on a process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of local analysis processes. Defaults to the CPU count.')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of posts analyzed and written back per batch.')
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='Number of rows fetched per round trip of the DB cursor.')
+        parser.add_argument('--max-rate', type=float, default=0,
+                            help='Maximum posts analyzed per second, 0 disables the limit.')
+        parser.add_argument('--checkpoint', type=str, default=None,
+                            help='File used to store the last processed post id.')
+        parser.add_argument('--reset', action='store_true',
+                            help='Ignore an existing checkpoint and start from the beginning.')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Stop after this many posts.')
+        parser.add_argument('--backend', choices=['processes', 'distributed'], default=settings.ANALYSIS_BACKEND,
+                            help='Analyze on a local process pool or on the dask cluster.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1 or options['chunk_size'] < 1:
+            raise CommandError('--batch-size and --chunk-size must be positive')
+
+        checkpoint = Path(options['checkpoint']) if options['checkpoint'] else None
+        last_id = 0 if options['reset'] else self.read_checkpoint(checkpoint)
+
+        queryset = Post.objects.filter(is_analysed=False, id__gt=last_id).order_by('id').values_list('id', 'uuid', stored_value('post_description'))
+        if options['limit']:
+            queryset = queryset[:options['limit']]
+
+        self.stdout.write(f'Analyzing backlog after post id {last_id}')
+
+        started = time.monotonic()
+        processed = failed = chars = 0
+        self.failed_ids = []
+
+        with self.executor(options) as executor:
+            batch = []
+            for row in queryset.iterator(chunk_size=options['chunk_size']):
+                batch.append(row)
+                if len(batch) < batch_size:
+                    continue
+                stats = self.process_batch(executor, batch, checkpoint)
+                processed, failed, chars = processed + stats[0], failed + stats[1], chars + stats[2]
+                self.report(processed, failed, chars, started)
+                self.throttle(processed + failed, started, options['max_rate'])
+                batch = []
+
+            if batch:
+                stats = self.process_batch(executor, batch, checkpoint)
+                processed, failed, chars = processed + stats[0], failed + stats[1], chars + stats[2]
+
+        shutdown_analysis_cluster()
+        self.report(processed, failed, chars, started)
+        if self.failed_ids:
+            self.stdout.write(self.style.WARNING(
+                f'Failed post ids, retried by the next run: {", ".join(str(pk) for pk in self.failed_ids)}'))
+        self.stdout.write(self.style.SUCCESS(f'Backlog done: {processed} analysed, {failed} failed'))
+
+    def executor(self, options: dict):
+        """
+        Return the executor analysing the backlog, the dask cluster's with the
+        distributed backend unless it is unreachable, otherwise a local process pool.
+        """
+        if options['backend'] == 'distributed':
+            client = get_distributed_client()
+            if client is not None:
+                self.stdout.write(f'Analyzing on cluster {client.scheduler.address}')
+                return client.get_executor(pure=False)
+            self.stdout.write(self.style.WARNING('Analysis cluster is not reachable, analysing locally'))
+        return ProcessPoolExecutor(max_workers=options['workers'])
+
+    def process_batch(self, executor, batch: list, checkpoint: Path) -> tuple:
+        """
+        Analyze a batch of rows on the pool and write the results back in bulk.
+
+        :return: Tuple of (analysed count, failed count, characters analyzed).
+        """
+        analysed_at = timezone.now()
+        posts = []
+        failed = 0
+        uuids = {pk: uuid for pk, uuid, _ in batch}
+        items = [(pk, bytes(stored) if stored is not None else None) for pk, _, stored in batch]
+        for pk, analyzed_data, error in executor.map(analyze_backlog_item, items):
+            if error:
+                failed += 1
+                self.failed_ids.append(pk)
+                logging.error(f'Backlog analysis of post {pk} failed: {error}')
+                continue
+            posts.append(Post(pk=pk, is_analysed=True, analysed_at=analysed_at, **analyzed_data))
+
+        with transaction.atomic():
+            previous = {row[0]: row[1:] for row in Post.objects.select_for_update().filter(
+                pk__in=[post.pk for post in posts]).values_list('id', 'is_analysed', 'total_words', 'average_word_length')}
+            Post.objects.bulk_update(posts, ['is_analysed', 'analysed_at', 'total_words', 'average_word_length'])
+            record_analyses(list(previous.values()), [
+                dict(total_words=post.total_words, average_word_length=post.average_word_length)
+                for post in posts if post.pk in previous])
+        invalidate_post_analysis(*[uuids[post.pk] for post in posts])
+        notify_analysis_written(*[uuids[post.pk] for post in posts])
+
+        # The checkpoint never passes a failed post, a resume retries it. The
+        # posts analysed after it are skipped by the is_analysed filter.
+        if self.failed_ids:
+            self.write_checkpoint(checkpoint, min(self.failed_ids) - 1)
+        else:
+            self.write_checkpoint(checkpoint, batch[-1][0])
+        return len(posts), failed, sum(stored_text_length(stored) for _, stored in items if stored is not None)
+
+    def throttle(self, done: int, started: float, max_rate: float) -> None:
+        """
+        Sleep long enough to keep the overall rate at or below max_rate posts per second.
+        """
+        if max_rate <= 0:
+            return
+        ahead = done / max_rate - (time.monotonic() - started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+    def report(self, processed: int, failed: int, chars: int, started: float) -> None:
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(
+            f'{processed + failed} posts in {elapsed:.1f}s: '
+            f'{(processed + failed) / elapsed:.1f} posts/s, {chars / elapsed / 1e6:.2f} Mchars/s, {failed} failed')
+
+    def read_checkpoint(self, checkpoint: Path) -> int:
+        if checkpoint is None or not checkpoint.exists():
+            return 0
+        try:
+            return int(json.loads(checkpoint.read_text())['last_id'])
+        except (ValueError, KeyError, TypeError):
+            raise CommandError(f'Corrupt checkpoint file {checkpoint}, use --reset to start over')
+
+    def write_checkpoint(self, checkpoint: Path, last_id: int) -> None:
+        if checkpoint is None:
+            return
+        tmp_path = checkpoint.with_suffix(checkpoint.suffix + '.tmp')
+        tmp_path.write_text(json.dumps({'last_id': last_id}))
+        tmp_path.replace(checkpoint)
@@ -0,0 +1,106 @@
+import json
+import time
+import uuid
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import JsonResponse
+from django.test import override_settings
+from django.utils import timezone
+
+from utils.response import (
+    EncodedResponseCache,
+    ResponseSerializer,
+    SendAsyncResponse,
+    compile_encoder,
+    orjson)
+from post.models import ANALYSIS_RESPONSE_SHAPE, Post
+
+
+def legacy_response(status: int, data=None, message: str = "", error_code=None) -> JsonResponse:
+    """
+    A response built the way SendAsyncResponse did before the compiled encoders.
+    """
+    return JsonResponse(data={
+        "status": status,
+        "data": ResponseSerializer.serialize(data),
+        "message": message,
+        "error_code": error_code
+    }, status=status, content_type="application/json")
+
+
+class Command(BaseCommand):
+    help = ('Measure the CPU time of building the analysis, error and post list responses with the '
+            'previous recursive serializer and with the compiled encoders of each JSON backend.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000,
+                            help='Responses built per measurement.')
+        parser.add_argument('--page-size', type=int, default=50,
+                            help='Posts in the post list response.')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['page_size'] < 1:
+            raise CommandError('--iterations and --page-size must be positive')
+
+        generator = random.Random(0)
+        posts = [Post(uuid=uuid.uuid4(), is_analysed=True, created_at=timezone.now(), analysed_at=timezone.now(),
+                      total_words=generator.randint(1, 500000), average_word_length=round(generator.uniform(2, 9), 2))
+                 for _ in range(options['page_size'])]
+        post = posts[0]
+        page = [{
+            'uuid': item.uuid,
+            'created_at': item.created_at,
+            'is_analysed': item.is_analysed,
+            'analysed_at': item.analysed_at,
+            'analysis': {'total_words': item.total_words, 'average_word_length': item.average_word_length}
+        } for item in posts]
+
+        cases = {
+            'legacy': {
+                'analysis': lambda: legacy_response(200, post.analysis_response, 'Fetched analysis successfully'),
+                'error': lambda: legacy_response(404, None, 'Post does not exist', 'PO404'),
+                'post_list': lambda: legacy_response(200, dict(posts=[ResponseSerializer.serialize(item) for item in page],
+                                                               next_cursor=None), 'Fetched posts successfully'),
+            },
+        }
+        for backend in ['json'] + (['orjson'] if orjson is not None else []):
+            encode = compile_encoder(ANALYSIS_RESPONSE_SHAPE, backend)
+            encoded_cache = EncodedResponseCache(max_size=1)
+            cases[backend] = {
+                'analysis': lambda encode=encode: SendAsyncResponse(
+                    200, encoded_data=encode(post.analysis_response), message='Fetched analysis successfully'),
+                'analysis_cached': lambda encode=encode, encoded_cache=encoded_cache: SendAsyncResponse(
+                    200, encoded_data=encoded_cache.get_or_encode(post.uuid, lambda: encode(post.analysis_response)),
+                    message='Fetched analysis successfully'),
+                'error': lambda: SendAsyncResponse(404, None, 'Post does not exist', 'PO404'),
+                'post_list': lambda: SendAsyncResponse(200, dict(posts=page, next_cursor=None),
+                                                       'Fetched posts successfully'),
+            }
+
+        expected = {shape: json.loads(build().content) for shape, build in cases['legacy'].items()}
+        report = {'iterations': options['iterations'], 'page_size': options['page_size'], 'cpu_us_per_response': {}}
+        for name, responses in cases.items():
+            with override_settings(RESPONSE_JSON_BACKEND=name if name != 'legacy' else 'json'):
+                self.check_bodies(responses, expected)
+                report['cpu_us_per_response'][name] = {
+                    shape: self.cpu_time(build, options['iterations']) for shape, build in responses.items()}
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def check_bodies(self, responses: dict, expected: dict) -> None:
+        """
+        Every variant has to render the same document as the legacy response.
+        """
+        for shape, build in responses.items():
+            if json.loads(build().content) != expected[shape.replace('_cached', '')]:
+                raise CommandError(f'The {shape} response differs from the legacy one')
+
+    def cpu_time(self, build, iterations: int) -> float:
+        """
+        :return: Average CPU time in microseconds of building one response.
+        """
+        build()
+        started = time.process_time()
+        for _ in range(iterations):
+            build()
+        return round((time.process_time() - started) / iterations * 1e6, 2)
@@ -0,0 +1,124 @@
+import json
+import math
+import time
+import random
+import string
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.compression import (
+    available_codecs,
+    compress_text,
+    decompress_text,
+    iter_stored_text,
+    stored_text_length)
+from post.core import divide_text, divide_text_chunks
+from post.fields import stored_value
+from post.models import Post
+from post.management.commands.loadtest import latency_summary
+
+
+class Command(BaseCommand):
+    help = ('Compare the stored size and read latency of post texts for every text codec, '
+            'on generated texts or on the posts in the DB, and print the results as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from-db', action='store_true',
+                            help='Use the texts of the stored posts instead of generated ones.')
+        parser.add_argument('--posts', type=int, default=200,
+                            help='Number of texts to benchmark.')
+        parser.add_argument('--size-mean', type=int, default=20000,
+                            help='Mean length in characters of the generated texts.')
+        parser.add_argument('--vocabulary', type=int, default=5000,
+                            help='Distinct words of the generated texts, fewer words compress better.')
+        parser.add_argument('--threshold', type=int, default=settings.POST_TEXT_COMPRESSION_THRESHOLD,
+                            help='Texts of fewer bytes are stored uncompressed.')
+        parser.add_argument('--random-seed', type=int, default=None,
+                            help='Seed of the generated texts, for repeatable runs.')
+
+    def handle(self, *args, **options):
+        if options['posts'] < 1:
+            raise CommandError('--posts must be positive')
+
+        texts = self.stored_texts(options) if options['from_db'] else self.generated_texts(options)
+        if not texts:
+            raise CommandError('No post texts to benchmark')
+
+        raw_bytes = sum(len(text.encode()) for text in texts)
+        results = {codec: self.benchmark_codec(codec, texts, options['threshold']) for codec in available_codecs()}
+        for result in results.values():
+            result['savings'] = round(1 - result['stored_bytes'] / raw_bytes, 4)
+
+        report = {
+            'posts': len(texts),
+            'characters': sum(len(text) for text in texts),
+            'raw_bytes': raw_bytes,
+            'codecs': results,
+            'largest_post_peak_memory_kib': self.peak_memory(max(texts, key=len)),
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def stored_texts(self, options: dict) -> list:
+        queryset = Post.objects.exclude(post_description=None).values_list(stored_value('post_description'), flat=True)
+        return [decompress_text(bytes(stored)) for stored in queryset.order_by('?')[:options['posts']]]
+
+    def generated_texts(self, options: dict) -> list:
+        generator = random.Random(options['random_seed'])
+        vocabulary = [''.join(generator.choices(string.ascii_lowercase, k=generator.randint(1, 12)))
+                      for _ in range(options['vocabulary'])]
+        # Word frequencies of natural language roughly follow Zipf's law.
+        weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+        texts = []
+        for _ in range(options['posts']):
+            # sigma 1 gives a long tail of big posts, mu keeps the mean at size_mean.
+            size = int(generator.lognormvariate(math.log(options['size_mean']) - 0.5, 1))
+            size = max(1, min(size, settings.MAX_SUPPORTED_LENGTH))
+            words = generator.choices(vocabulary, weights, k=size // 4 + 1)
+            texts.append(' '.join(words)[:size].strip() or vocabulary[0])
+        return texts
+
+    def benchmark_codec(self, codec: str, texts: list, threshold: int) -> dict:
+        """
+        :return: Stored size of the texts with the codec and per post latencies
+            in milliseconds of writing, fully reading and reading them as analysis parts.
+        """
+        stored_texts, write_ms, read_ms, parts_ms = [], [], [], []
+        for text in texts:
+            started = time.perf_counter()
+            stored_texts.append(compress_text(text, codec, threshold))
+            write_ms.append((time.perf_counter() - started) * 1000)
+
+        for stored in stored_texts:
+            started = time.perf_counter()
+            decompress_text(stored)
+            read_ms.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            for _ in divide_text_chunks(iter_stored_text(stored), stored_text_length(stored)):
+                pass
+            parts_ms.append((time.perf_counter() - started) * 1000)
+
+        return {
+            'stored_bytes': sum(len(stored) for stored in stored_texts),
+            'write_ms': latency_summary(write_ms),
+            'read_ms': latency_summary(read_ms),
+            'read_parts_ms': latency_summary(parts_ms),
+        }
+
+    def peak_memory(self, text: str) -> dict:
+        """
+        Peak memory of cutting a stored text into analysis parts, with the
+        whole text decompressed first and while it is decompressed.
+        """
+        stored = compress_text(text, 'auto')
+        peaks = {}
+        for name, parts in (('whole', lambda: list(divide_text(decompress_text(stored)))),
+                            ('streamed', lambda: list(divide_text_chunks(iter_stored_text(stored),
+                                                                         stored_text_length(stored))))):
+            tracemalloc.start()
+            parts()
+            peaks[name] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+            tracemalloc.stop()
+        return peaks
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from post.stats import STATS_FIELDS, compute_corpus_stats, rebuild_corpus_stats, stored_corpus_stats
+
+
+class Command(BaseCommand):
+    help = 'Verify the incrementally maintained corpus statistics against the post table, or rebuild them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute the statistics from scratch.')
+        parser.add_argument('--fix', action='store_true',
+                            help='Rebuild the statistics only when drift is found.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.rebuild()
+            return
+
+        drift = self.drift(stored_corpus_stats(), compute_corpus_stats())
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Corpus statistics match the post table'))
+            return
+
+        for field, (stored, actual) in drift.items():
+            self.stdout.write(f'{field}: stored {stored}, actual {actual}, drift {stored - actual}')
+        if options['fix']:
+            self.rebuild()
+            return
+        raise CommandError('Corpus statistics drifted, run with --rebuild to fix them')
+
+    def rebuild(self) -> None:
+        totals = rebuild_corpus_stats()
+        self.stdout.write(self.style.SUCCESS(
+            'Corpus statistics rebuilt: ' + ', '.join(f'{field}={totals[field]}' for field in STATS_FIELDS)))
+
+    def drift(self, stored: dict, actual: dict) -> dict:
+        """
+        :return: Mapping of field to (stored, actual) for the fields that differ.
+        """
+        drift = dict()
+        for field in STATS_FIELDS:
+            stored_value, actual_value = stored[field] or 0, actual[field] or 0
+            # total_word_length is a float sum, allow for rounding of the deltas.
+            if abs(stored_value - actual_value) > 1e-6 * max(1, abs(actual_value)):
+                drift[field] = (stored_value, actual_value)
+        return drift
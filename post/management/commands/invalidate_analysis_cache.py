@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from utils.caching_functions import bump_analysis_cache_version
+
+
+class Command(BaseCommand):
+    help = 'Invalidate every cached post analysis by moving to a new cache key version.'
+
+    def handle(self, *args, **options):
+        version = bump_analysis_cache_version()
+        self.stdout.write(self.style.SUCCESS(f'Analysis cache moved to version {version}'))
@@ -0,0 +1,358 @@
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import threading
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+OPERATIONS = ('create', 'cold', 'cached')
+WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do',
+         'eiusmod', 'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna', 'aliqua')
+
+
+class ASGITransport:
+
+    """
+    Send requests straight to an ASGI application in this process.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method: str, path: str, body: bytes = b'') -> tuple:
+        """
+        :return: Tuple of (status code, headers with lower case names, body).
+        """
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+            'query_string': query.encode(), 'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'content-type', b'application/json'),
+                        (b'content-length', str(len(body)).encode())],
+            'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        response = {'status': None, 'headers': {}, 'body': []}
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # Nothing more to send, wait like a client keeping the connection open.
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = {name.decode().lower(): value.decode() for name, value in message['headers']}
+            elif message['type'] == 'http.response.body':
+                response['body'].append(message.get('body', b''))
+
+        await self.app(scope, receive, send)
+        return response['status'], response['headers'], b''.join(response['body'])
+
+    def close(self) -> None:
+        pass
+
+
+class HTTPTransport:
+
+    """
+    Send requests to a running server, one keep-alive connection per thread.
+    """
+
+    def __init__(self, base_url: str, concurrency: int):
+        url = urlsplit(base_url)
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError(f'Unsupported url {base_url}, expected http://host:port')
+        self.host, self.port, self.prefix = url.hostname, url.port or 80, url.path.rstrip('/')
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='loadtest')
+        self.local = threading.local()
+
+    def send(self, method: str, path: str, body: bytes) -> tuple:
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        try:
+            connection.request(method, self.prefix + path, body=body or None,
+                               headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            return response.status, {name.lower(): value for name, value in response.getheaders()}, response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self.local.connection = None
+            raise
+
+    async def request(self, method: str, path: str, body: bytes = b'') -> tuple:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.send, method, path, body)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+def percentile(values: list, p: float) -> float:
+    """
+    Nearest rank percentile of pre sorted values.
+    """
+    if not values:
+        return None
+    return round(values[max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))], 3)
+
+
+def latency_summary(values: list) -> dict:
+    values = sorted(values)
+    return {
+        'p50': percentile(values, 50), 'p95': percentile(values, 95),
+        'p99': percentile(values, 99), 'max': percentile(values, 100),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Drive create_post and get_post_analysis with a mix of creates, cold analyses and cached '
+            'reads and report latency percentiles, throughput, errors and cache hit ratio as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', type=str, default=None,
+                            help='Base url of the post API, e.g. http://127.0.0.1:8000/api/v1/post. '
+                                 'Without it the ASGI application is driven in this process.')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Seconds to generate load for.')
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help='Requests in flight at a time.')
+        parser.add_argument('--rps', type=float, default=0,
+                            help='Target requests per second, 0 sends as fast as the concurrency allows.')
+        parser.add_argument('--mix', type=str, default='create=10,cold=20,cached=70',
+                            help='Relative weights of the operations.')
+        parser.add_argument('--seed-posts', type=int, default=200,
+                            help='Posts created before the measurement starts.')
+        parser.add_argument('--seed-analysed', type=float, default=0.5,
+                            help='Fraction of the seeded posts analysed before the measurement starts.')
+        parser.add_argument('--size-distribution', choices=['fixed', 'uniform', 'lognormal'], default='lognormal',
+                            help='Distribution of the post lengths.')
+        parser.add_argument('--size-mean', type=int, default=2000,
+                            help='Mean post length in characters.')
+        parser.add_argument('--size-max', type=int, default=None,
+                            help='Longest post in characters, defaults to MAX_SUPPORTED_LENGTH.')
+        parser.add_argument('--random-seed', type=int, default=None,
+                            help='Seed of the size and operation choices, for repeatable runs.')
+        parser.add_argument('--output', type=str, default=None,
+                            help='File to write the JSON report to instead of stdout.')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['duration'] <= 0:
+            raise CommandError('--concurrency and --duration must be positive')
+
+        self.mix = self.parse_mix(options['mix'])
+        self.random = random.Random(options['random_seed'])
+        self.options = options
+        size_max = options['size_max'] or settings.MAX_SUPPORTED_LENGTH
+        self.size_max = min(size_max, settings.MAX_SUPPORTED_LENGTH)
+        self.text_block = ' '.join(self.random.choice(WORDS) for _ in range(self.size_max // 5 + 1))
+
+        report = asyncio.run(self.run())
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+            self.stderr.write(f'Report written to {options["output"]}')
+        else:
+            self.stdout.write(output)
+
+    def parse_mix(self, mix: str) -> dict:
+        try:
+            weights = {name.strip(): float(weight) for name, weight in
+                       (item.split('=') for item in mix.split(',') if item.strip())}
+        except ValueError:
+            raise CommandError(f'Invalid --mix {mix}, expected e.g. create=10,cold=20,cached=70')
+        unknown = set(weights) - set(OPERATIONS)
+        if unknown or not weights or sum(weights.values()) <= 0 or min(weights.values()) < 0:
+            raise CommandError(f'Invalid --mix {mix}, operations are {", ".join(OPERATIONS)}')
+        return weights
+
+    def post_size(self) -> int:
+        mean = self.options['size_mean']
+        distribution = self.options['size_distribution']
+        if distribution == 'uniform':
+            size = self.random.randint(1, 2 * mean)
+        elif distribution == 'lognormal':
+            # sigma 1 gives a long tail of big posts, mu keeps the mean at size_mean.
+            size = int(self.random.lognormvariate(math.log(mean) - 0.5, 1))
+        else:
+            size = mean
+        return max(1, min(size, self.size_max))
+
+    def post_body(self, post_id: str) -> bytes:
+        size = self.post_size()
+        offset = self.random.randrange(max(1, len(self.text_block) - size))
+        text = self.text_block[offset:offset + size].strip() or WORDS[0]
+        return json.dumps({'uuid': post_id, 'post_description': text}).encode()
+
+    def make_transport(self):
+        if self.options['url']:
+            return HTTPTransport(self.options['url'], self.options['concurrency']), '', False
+
+        from post_analyzer.asgi import application
+        return ASGITransport(application), '/api/v1/post', True
+
+    async def run(self) -> dict:
+        transport, prefix, in_process = self.make_transport()
+        self.prefix = prefix
+        self.cold_posts, self.warm_posts = [], []
+        try:
+            if in_process:
+                from post_analyzer.lifespan import worker_startup
+                from post.analysis_pool import warm_analysis_pool
+                # Worker and pool start up are not part of the measurement.
+                await asyncio.get_running_loop().run_in_executor(None, worker_startup)
+                await asyncio.get_running_loop().run_in_executor(None, warm_analysis_pool)
+
+            await self.seed(transport)
+            return await self.measure(transport)
+        finally:
+            transport.close()
+            if in_process:
+                from post_analyzer.lifespan import worker_shutdown
+                await asyncio.get_running_loop().run_in_executor(None, worker_shutdown)
+
+    async def gather_limited(self, coroutines: list) -> None:
+        semaphore = asyncio.Semaphore(self.options['concurrency'])
+
+        async def limited(coroutine):
+            async with semaphore:
+                await coroutine
+
+        await asyncio.gather(*[limited(coroutine) for coroutine in coroutines])
+
+    async def seed(self, transport) -> None:
+        seed_posts = self.options['seed_posts']
+        seed_ids = [str(uuid.uuid4()) for _ in range(seed_posts)]
+        self.stderr.write(f'Seeding {seed_posts} posts')
+
+        async def create(post_id):
+            status, _, _ = await transport.request('POST', f'{self.prefix}/', self.post_body(post_id))
+            if status == 201:
+                self.cold_posts.append(post_id)
+
+        await self.gather_limited([create(post_id) for post_id in seed_ids])
+
+        to_analyse = self.cold_posts[:int(len(self.cold_posts) * self.options['seed_analysed'])]
+        del self.cold_posts[:len(to_analyse)]
+
+        async def analyse(post_id):
+            status, _, _ = await transport.request('GET', f'{self.prefix}/{post_id}/analyze')
+            (self.warm_posts if status == 200 else self.cold_posts).append(post_id)
+
+        await self.gather_limited([analyse(post_id) for post_id in to_analyse])
+        self.stderr.write(f'Seeded {len(self.cold_posts)} unanalysed and {len(self.warm_posts)} analysed posts')
+
+    def choose_operation(self) -> str:
+        operation = self.random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        if operation == 'cold' and not self.cold_posts:
+            operation = 'create'
+        if operation == 'cached' and not self.warm_posts:
+            operation = 'cold' if self.cold_posts else 'create'
+        return operation
+
+    async def perform(self, transport, operation: str) -> tuple:
+        if operation == 'create':
+            post_id = str(uuid.uuid4())
+            status, headers, _ = await transport.request('POST', f'{self.prefix}/', self.post_body(post_id))
+            if status == 201:
+                self.cold_posts.append(post_id)
+            return status, headers
+
+        if operation == 'cold':
+            post_id = self.cold_posts.pop(self.random.randrange(len(self.cold_posts)))
+            status, headers, _ = await transport.request('GET', f'{self.prefix}/{post_id}/analyze')
+            (self.warm_posts if status == 200 else self.cold_posts).append(post_id)
+            return status, headers
+
+        post_id = self.random.choice(self.warm_posts)
+        status, headers, _ = await transport.request('GET', f'{self.prefix}/{post_id}/analyze')
+        return status, headers
+
+    async def measure(self, transport) -> dict:
+        duration, rps = self.options['duration'], self.options['rps']
+        latencies = {operation: [] for operation in OPERATIONS}
+        statuses = {operation: {} for operation in OPERATIONS}
+        cache_results = {'HIT': 0, 'MISS': 0}
+        schedule = {'next': 0.0}
+
+        started = time.monotonic()
+        deadline = started + duration
+        schedule['next'] = started
+
+        async def worker():
+            while True:
+                if rps > 0:
+                    # Open loop pacing, latency counts from the scheduled start so
+                    # a slow server is not hidden by requests starting late.
+                    scheduled = schedule['next']
+                    schedule['next'] += 1 / rps
+                    if scheduled >= deadline:
+                        return
+                    await asyncio.sleep(max(0, scheduled - time.monotonic()))
+                else:
+                    scheduled = time.monotonic()
+                    if scheduled >= deadline:
+                        return
+
+                operation = self.choose_operation()
+                try:
+                    status, headers = await self.perform(transport, operation)
+                except Exception as e:
+                    status, headers = type(e).__name__, {}
+
+                latencies[operation].append((time.monotonic() - scheduled) * 1000)
+                statuses[operation][str(status)] = statuses[operation].get(str(status), 0) + 1
+                if operation != 'create' and headers.get('x-cache') in cache_results:
+                    cache_results[headers['x-cache']] += 1
+
+        self.stderr.write(f'Generating load for {duration}s at concurrency {self.options["concurrency"]}')
+        await asyncio.gather(*[worker() for _ in range(self.options['concurrency'])])
+        elapsed = time.monotonic() - started
+
+        return self.report(latencies, statuses, cache_results, elapsed)
+
+    def report(self, latencies: dict, statuses: dict, cache_results: dict, elapsed: float) -> dict:
+        expected_status = {'create': '201', 'cold': '200', 'cached': '200'}
+        operations = dict()
+        total_requests = total_errors = 0
+        for operation in OPERATIONS:
+            requests = len(latencies[operation])
+            errors = sum(count for status, count in statuses[operation].items() if status != expected_status[operation])
+            total_requests, total_errors = total_requests + requests, total_errors + errors
+            operations[operation] = {
+                'requests': requests,
+                'throughput_rps': round(requests / elapsed, 2),
+                'error_rate': round(errors / requests, 4) if requests else 0,
+                'status_codes': statuses[operation],
+                'latency_ms': latency_summary(latencies[operation]),
+            }
+
+        lookups = cache_results['HIT'] + cache_results['MISS']
+        return {
+            'target': self.options['url'] or 'in-process ASGI',
+            'python': sys.version.split()[0],
+            'duration_s': round(elapsed, 3),
+            'concurrency': self.options['concurrency'],
+            'target_rps': self.options['rps'] or None,
+            'mix': self.mix,
+            'post_size': {'distribution': self.options['size_distribution'], 'mean': self.options['size_mean'],
+                          'max': self.size_max},
+            'requests': total_requests,
+            'throughput_rps': round(total_requests / elapsed, 2),
+            'error_rate': round(total_errors / total_requests, 4) if total_requests else 0,
+            'cache_hit_ratio': round(cache_results['HIT'] / lookups, 4) if lookups else None,
+            'latency_ms': latency_summary([value for values in latencies.values() for value in values]),
+            'operations': operations,
+        }
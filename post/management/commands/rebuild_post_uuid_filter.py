@@ -0,0 +1,32 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from post.uuid_filter import create_post_uuid_filter, load_post_uuid_filter
+from utils.bloom import LocalScalableBloomFilter
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Bloom filter of post uuids used by create_post from the post table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Number of uuids fetched and added per round trip.')
+        parser.add_argument('--stats', action='store_true',
+                            help='Only print the size, layers and estimated false positive rate of the filter.')
+
+    def handle(self, *args, **options):
+        bloom = create_post_uuid_filter()
+        if isinstance(bloom, LocalScalableBloomFilter):
+            self.stdout.write(self.style.WARNING(
+                'The default cache is not Redis, every process builds its own filter when it starts. '
+                'Building one here to report its figures.'))
+
+        if not options['stats'] or isinstance(bloom, LocalScalableBloomFilter):
+            started = time.monotonic()
+            added = load_post_uuid_filter(bloom, options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Added {added} post uuids to the filter in {time.monotonic() - started:.1f}s'))
+
+        self.stdout.write(json.dumps(bloom.stats(), indent=2))
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.4 on 2026-10-19 04:30
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('post', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Post',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('post_description', models.TextField(null=True)),
+                ('is_analysed', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('analysed_at', models.DateTimeField(auto_now=True)),
+                ('total_words', models.IntegerField(default=0)),
+                ('average_word_length', models.FloatField(default=0.0)),
+            ],
+        ),
+    ]
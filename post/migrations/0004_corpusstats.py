@@ -0,0 +1,46 @@
+# Generated by Django 4.2.4 on 2026-10-19 03:41
+
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+
+
+def seed_corpus_stats(apps, schema_editor):
+    """
+    Store the totals of the posts created before the counters existed in shard 0.
+    """
+    Post = apps.get_model('post', 'Post')
+    CorpusStats = apps.get_model('post', 'CorpusStats')
+    db_alias = schema_editor.connection.alias
+
+    analysed = Q(is_analysed=True)
+    totals = Post.objects.using(db_alias).aggregate(
+        posts=Count('id'),
+        analysed_posts=Count('id', filter=analysed),
+        words=Sum('total_words', filter=analysed),
+        word_length=Sum(F('total_words') * F('average_word_length'), filter=analysed))
+    CorpusStats.objects.using(db_alias).create(
+        shard=0, total_posts=totals['posts'] or 0, analysed_posts=totals['analysed_posts'] or 0,
+        total_words=totals['words'] or 0, total_word_length=totals['word_length'] or 0.0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0003_post_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorpusStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(unique=True)),
+                ('total_posts', models.BigIntegerField(default=0)),
+                ('analysed_posts', models.BigIntegerField(default=0)),
+                ('total_words', models.BigIntegerField(default=0)),
+                ('total_word_length', models.FloatField(default=0.0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(seed_corpus_stats, migrations.RunPython.noop),
+    ]
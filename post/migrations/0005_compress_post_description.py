@@ -0,0 +1,62 @@
+# Generated by Django 4.2.4 on 2026-10-19 05:12
+
+from django.db import migrations
+import post.fields
+
+# Posts converted per UPDATE, so the conversion never holds the whole table in memory.
+BATCH_SIZE = 500
+
+
+def copy_post_descriptions(apps, schema_editor, source: str, target: str) -> None:
+    """
+    Copy every post text from one column to the other in id order, through
+    the fields so CompressedTextField writes or reads the stored header format.
+    """
+    Post = apps.get_model('post', 'Post')
+    posts = Post.objects.using(schema_editor.connection.alias).exclude(**{source: None}).order_by('id')
+    last_id = 0
+    while True:
+        batch = list(posts.filter(id__gt=last_id).only('id', source)[:BATCH_SIZE])
+        if not batch:
+            return
+        for row in batch:
+            setattr(row, target, getattr(row, source))
+        Post.objects.using(schema_editor.connection.alias).bulk_update(batch, [target])
+        last_id = batch[-1].id
+
+
+def compress_post_descriptions(apps, schema_editor):
+    copy_post_descriptions(apps, schema_editor, 'post_description', 'stored_description')
+
+
+def decompress_post_descriptions(apps, schema_editor):
+    copy_post_descriptions(apps, schema_editor, 'stored_description', 'post_description')
+
+
+class Migration(migrations.Migration):
+
+    # Altering the column type in place would keep the plain TEXT values,
+    # which lack the codec and length header stored texts are read with.
+    # The texts are rewritten into a new column which then replaces the old one.
+
+    dependencies = [
+        ('post', '0004_corpusstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='stored_description',
+            field=post.fields.CompressedTextField(editable=True, null=True),
+        ),
+        migrations.RunPython(compress_post_descriptions, decompress_post_descriptions),
+        migrations.RemoveField(
+            model_name='post',
+            name='post_description',
+        ),
+        migrations.RenameField(
+            model_name='post',
+            old_name='stored_description',
+            new_name='post_description',
+        ),
+    ]
@@ -1,17 +1,39 @@
 from django.db import models
 import uuid
 
+from utils.response import BOOLEAN, INTEGER, NUMBER, UUID, compile_encoder, get_encoded_response_cache
+from .fields import CompressedTextField
+
+ANALYSIS_RESPONSE_SHAPE = {
+    'uid': UUID,
+    'analysis': {
+        'total_words': INTEGER,
+        'average_word_length': NUMBER
+    },
+    'is_analysed': BOOLEAN
+}
+
 
 class Post(models.Model):
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
-    post_description = models.TextField(null=True)
+    post_description = CompressedTextField(null=True)
     is_analysed = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     analysed_at = models.DateTimeField(auto_now=True)
     total_words = models.IntegerField(default=0)
     average_word_length = models.FloatField(default=0.00)
 
+    class Meta:
+        # Keyset pagination of the listing walks (created_at, id), optionally
+        # within is_analysed, and filters on analysed_at ranges. Pages of an
+        # analysed_at range are sorted after the range is read, see list_posts_async.
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='post_created_id_idx'),
+            models.Index(fields=['is_analysed', 'created_at', 'id'], name='post_analysed_created_id_idx'),
+            models.Index(fields=['analysed_at'], name='post_analysed_at_idx'),
+        ]
+
     def __str__(self):
         return str(self.uuid)
 
@@ -25,3 +47,38 @@ class Post(models.Model):
             },
             'is_analysed': self.is_analysed
         }
+
+    @property
+    def encoded_analysis_response(self) -> bytes:
+        """
+        analysis_response encoded as JSON. An analysis never changes until
+        the post is analysed again, so the encoded form of an analysed post is
+        cached under its analysed_at.
+        """
+        if not self.is_analysed:
+            return encode_analysis_response(self.analysis_response)
+        return get_encoded_response_cache().get_or_encode(
+            ('analysis', self.uuid, self.analysed_at), lambda: encode_analysis_response(self.analysis_response))
+
+
+encode_analysis_response = compile_encoder(ANALYSIS_RESPONSE_SHAPE)
+
+
+class CorpusStats(models.Model):
+    """
+    One shard of the corpus wide counters kept up to date by post.stats.
+
+    Writers add their deltas to a random shard so concurrent transactions do
+    not queue on a single row, the corpus totals are the sum of all shards.
+    Word figures only count analysed posts, total_word_length is the sum of
+    total_words * average_word_length.
+    """
+    shard = models.PositiveSmallIntegerField(unique=True)
+    total_posts = models.BigIntegerField(default=0)
+    analysed_posts = models.BigIntegerField(default=0)
+    total_words = models.BigIntegerField(default=0)
+    total_word_length = models.FloatField(default=0.0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'corpus stats shard {self.shard}'
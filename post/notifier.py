@@ -0,0 +1,153 @@
+import time
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+
+from utils.caching_functions import analysis_in_progress
+from utils.metrics import metrics
+
+ANALYSIS_WRITTEN_CHANNEL = 'post_analysis_written'
+
+
+class AnalysisNotifier:
+
+    """
+    Wake requests waiting for the analysis of a post to be written.
+
+    Waiters park on an asyncio.Event of their own event loop. publish() wakes
+    the waiters of this process directly and, with a Redis client, publishes
+    the post id on a pub/sub channel that a listener thread in every process
+    relays to its own waiters. Without Redis only this process is notified.
+
+    Usage:
+        async with get_analysis_notifier().subscription(post_id) as written:
+            await asyncio.wait_for(written.wait(), timeout)
+
+        get_analysis_notifier().publish(post_id)
+    """
+
+    def __init__(self, client=None, channel: str = ANALYSIS_WRITTEN_CHANNEL):
+        self.client = client
+        self.channel = channel
+        self._waiters = dict()
+        self._lock = threading.Lock()
+        self._listener = None
+
+    @asynccontextmanager
+    async def subscription(self, post_id: str):
+        key = str(post_id).lower()
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        self.start_listener()
+        with self._lock:
+            self._waiters.setdefault(key, set()).add(waiter)
+            metrics.gauge('notifier.waiting_posts', len(self._waiters))
+        try:
+            yield waiter[1]
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(key, set())
+                waiters.discard(waiter)
+                if not waiters:
+                    self._waiters.pop(key, None)
+                metrics.gauge('notifier.waiting_posts', len(self._waiters))
+
+    def publish(self, post_id: str) -> None:
+        key = str(post_id).lower()
+        self.wake(key)
+        if self.client is None:
+            return
+        try:
+            self.client.publish(self.channel, key)
+        except Exception as e:
+            logging.error(f'Unable to publish analysis of {key}: {str(e)}')
+
+    def wake(self, key: str) -> None:
+        with self._lock:
+            waiters = list(self._waiters.get(key, ()))
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The waiter's event loop is already closed.
+                pass
+
+    def start_listener(self) -> None:
+        if self.client is None or self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self.listen, name='analysis-notifier', daemon=True)
+                self._listener.start()
+
+    def listen(self) -> None:
+        """
+        Relay analysis notifications of every process to the local waiters,
+        reconnecting with backoff when the connection drops.
+        """
+        backoff = 1
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                backoff = 1
+                for message in pubsub.listen():
+                    data = message.get('data')
+                    self.wake(data.decode() if isinstance(data, bytes) else str(data))
+
+            except Exception as e:
+                logging.error(f'Analysis notification listener failed: {str(e)}')
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+
+_analysis_notifier = None
+_analysis_notifier_lock = threading.Lock()
+
+
+def get_analysis_notifier() -> AnalysisNotifier:
+    """
+    Return the process wide notifier, on Redis pub/sub when the default cache
+    is django-redis and in-process otherwise.
+    """
+    global _analysis_notifier
+    if _analysis_notifier is None:
+        with _analysis_notifier_lock:
+            if _analysis_notifier is None:
+                try:
+                    from django_redis import get_redis_connection
+                    client = get_redis_connection('default')
+                except NotImplementedError:
+                    client = None
+                _analysis_notifier = AnalysisNotifier(client)
+    return _analysis_notifier
+
+
+def notify_analysis_written(*post_ids: str) -> None:
+    notifier = get_analysis_notifier()
+    for post_id in post_ids:
+        notifier.publish(post_id)
+
+
+async def wait_for_analysis(post_id: str, timeout: float):
+    """
+    Wait for the analysis another request is running on a post.
+
+    Subscribes before checking the in-progress marker, so a notification
+    sent in between is not missed.
+
+    :return: None when no analysis of the post is in progress, True once its
+        analysis was written or abandoned, False when timeout seconds passed first.
+    """
+    async with get_analysis_notifier().subscription(post_id) as written:
+        if not await sync_to_async(analysis_in_progress)(post_id):
+            return None
+        try:
+            await asyncio.wait_for(written.wait(), timeout)
+        except asyncio.TimeoutError:
+            metrics.incr('long_poll.timed_out')
+            return False
+        metrics.incr('long_poll.notified')
+        return True
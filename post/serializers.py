@@ -1,6 +1,16 @@
+from django.conf import settings
 from rest_framework import serializers
 
 
 class PostValidationSerializer(serializers.Serializer):
     uuid = serializers.CharField(min_length=1, max_length=200)
     post_description = serializers.CharField(min_length=1)
+
+
+class PostListQuerySerializer(serializers.Serializer):
+    cursor = serializers.CharField(required=False, max_length=200)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=settings.POST_LIST_MAX_PAGE_SIZE,
+                                     default=settings.POST_LIST_PAGE_SIZE)
+    is_analysed = serializers.BooleanField(required=False, allow_null=True, default=None)
+    analysed_after = serializers.DateTimeField(required=False)
+    analysed_before = serializers.DateTimeField(required=False)
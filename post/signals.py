@@ -0,0 +1,46 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from utils.caching_functions import invalidate_post_analysis
+from .models import Post
+from .stats import record_post_created, record_post_deleted
+from .uuid_filter import add_post_uuid
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_cached_analysis(sender, instance: Post, created: bool = False, **kwargs) -> None:
+    """
+    Drop the cached analysis whenever an existing post row is saved or
+    deleted, e.g. from the admin. Queryset updates do not send these signals,
+    the code issuing them refreshes the cache itself.
+    """
+    if not created:
+        invalidate_post_analysis(instance.uuid)
+
+
+@receiver(post_save, sender=Post)
+def count_created_post(sender, instance: Post, created: bool = False, **kwargs) -> None:
+    """
+    Add a new post to the corpus statistics, inside the transaction creating it.
+    """
+    if created:
+        record_post_created(instance)
+
+
+@receiver(post_save, sender=Post)
+def remember_post_uuid(sender, instance: Post, created: bool = False, **kwargs) -> None:
+    """
+    Add a new post's uuid to the post uuid filter. It is added before the
+    transaction commits, a rollback only leaves a harmless false positive.
+    """
+    if created:
+        add_post_uuid(instance.uuid)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_deleted_post(sender, instance: Post, **kwargs) -> None:
+    """
+    Remove a deleted post from the corpus statistics, inside the transaction deleting it.
+    """
+    record_post_deleted(instance)
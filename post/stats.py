@@ -0,0 +1,138 @@
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from post_analyzer.db_router import PRIMARY_DATABASE
+
+from .models import CorpusStats, Post
+
+STATS_FIELDS = ('total_posts', 'analysed_posts', 'total_words', 'total_word_length')
+
+
+def analysis_contribution(is_analysed: bool, total_words: int, average_word_length: float) -> dict:
+    """
+    Return what a single post adds to the corpus statistics.
+    """
+    if not is_analysed:
+        return dict(analysed_posts=0, total_words=0, total_word_length=0.0)
+    return dict(analysed_posts=1, total_words=total_words,
+                total_word_length=total_words * average_word_length)
+
+
+def apply_corpus_stats_delta(**delta) -> None:
+    """
+    Add a delta to one corpus statistics shard.
+
+    Must run inside the transaction writing the posts it accounts for, so
+    the statistics commit or roll back together with them.
+
+    :param delta: Increments keyed by the CorpusStats field names, zeros are skipped.
+    """
+    delta = {field: value for field, value in delta.items() if value}
+    if not delta:
+        return
+
+    shard = random.randrange(settings.CORPUS_STATS_SHARDS)
+    increments = {field: F(field) + value for field, value in delta.items()}
+    increments['updated_at'] = timezone.now()
+    if not CorpusStats.objects.filter(shard=shard).update(**increments):
+        CorpusStats.objects.get_or_create(shard=shard)
+        CorpusStats.objects.filter(shard=shard).update(**increments)
+
+
+def record_post_created(post: Post) -> None:
+    apply_corpus_stats_delta(total_posts=1, **analysis_contribution(
+        post.is_analysed, post.total_words, post.average_word_length))
+
+
+def record_post_deleted(post: Post) -> None:
+    contribution = analysis_contribution(post.is_analysed, post.total_words, post.average_word_length)
+    apply_corpus_stats_delta(total_posts=-1, **{field: -value for field, value in contribution.items()})
+
+
+def record_analyses(previous: list, analysed: list) -> None:
+    """
+    Account for analysis results written over existing posts.
+
+    :param previous: (is_analysed, total_words, average_word_length) of the
+        rows before the write, read with select_for_update in the same transaction.
+    :param analysed: Analyzed data written to those rows.
+    """
+    delta = dict(analysed_posts=0, total_words=0, total_word_length=0.0)
+    for row in previous:
+        for field, value in analysis_contribution(*row).items():
+            delta[field] -= value
+    for analyzed_data in analysed:
+        for field, value in analysis_contribution(True, **analyzed_data).items():
+            delta[field] += value
+    apply_corpus_stats_delta(**delta)
+
+
+def summarize(totals: dict) -> dict:
+    """
+    Turn raw corpus totals into the figures served by the stats endpoint.
+    """
+    total_words = totals['total_words'] or 0
+    return {
+        'total_posts': totals['total_posts'] or 0,
+        'analysed_posts': totals['analysed_posts'] or 0,
+        'backlog': (totals['total_posts'] or 0) - (totals['analysed_posts'] or 0),
+        'total_words': total_words,
+        'average_word_length': round((totals['total_word_length'] or 0) / total_words, 2) if total_words else 0,
+    }
+
+
+def read_corpus_stats() -> dict:
+    """
+    Sum the statistics shards, a handful of rows whatever the corpus size.
+    """
+    totals = CorpusStats.objects.aggregate(**{field: Sum(field) for field in STATS_FIELDS})
+    return summarize(totals)
+
+
+def compute_corpus_stats() -> dict:
+    """
+    Aggregate the raw totals over the whole post table, used to rebuild and verify.
+
+    Reads the primary, a lagging replica would report drift that is not there.
+    """
+    analysed = Q(is_analysed=True)
+    # Aliases may not shadow the Post fields being summed.
+    totals = Post.objects.using(PRIMARY_DATABASE).aggregate(
+        posts=Count('id'),
+        analysed_posts=Count('id', filter=analysed),
+        words=Sum('total_words', filter=analysed),
+        word_length=Sum(F('total_words') * F('average_word_length'), filter=analysed))
+    return dict(total_posts=totals['posts'], analysed_posts=totals['analysed_posts'],
+                total_words=totals['words'], total_word_length=totals['word_length'])
+
+
+def stored_corpus_stats() -> dict:
+    return CorpusStats.objects.using(PRIMARY_DATABASE).aggregate(**{field: Sum(field) for field in STATS_FIELDS})
+
+
+def rebuild_corpus_stats() -> dict:
+    """
+    Recompute the statistics from the post table and store them in shard 0.
+
+    Every shard is locked before the aggregate runs. Writers that committed
+    earlier are part of the aggregate, writers still in flight wait on the
+    lock and apply their delta on top of the rebuilt totals.
+
+    :return: The rebuilt raw totals.
+    """
+    shards = CorpusStats.objects.using(PRIMARY_DATABASE)
+    for shard in range(settings.CORPUS_STATS_SHARDS):
+        shards.get_or_create(shard=shard)
+
+    with transaction.atomic(using=PRIMARY_DATABASE):
+        list(shards.select_for_update().order_by('shard').values_list('id'))
+        totals = {field: value or 0 for field, value in compute_corpus_stats().items()}
+        shards.exclude(shard=0).update(
+            updated_at=timezone.now(), **{field: 0 for field in STATS_FIELDS})
+        shards.filter(shard=0).update(updated_at=timezone.now(), **totals)
+        shards.filter(shard__gte=settings.CORPUS_STATS_SHARDS).delete()
+    return totals
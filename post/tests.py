@@ -0,0 +1,1080 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import string
+import datetime
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from unittest import mock
+from decimal import Decimal
+from concurrent.futures import CancelledError
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, router
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+from unittest import skipUnless
+
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+
+from exceptions.service_error import ServiceException
+from post_analyzer.lifespan import LifespanMiddleware
+from post_analyzer.db_router import pin_post_to_primary, read_database_for_post, replica_pin_cache_key
+from utils.caching_functions import (
+    ANALYSIS_CACHE_VERSION_KEY,
+    analysis_cache_version,
+    cache_analysis_response,
+    get_cached_analysis_response,
+    mark_analysis_in_progress)
+from utils.bloom import LocalScalableBloomFilter, RedisScalableBloomFilter
+from utils.compression import (
+    available_codecs,
+    compress_text,
+    decompress_text,
+    iter_stored_text,
+    stored_text_codec,
+    stored_text_length)
+from utils.response import (
+    EncodedResponseCache,
+    ResponseSerializer,
+    SendAsyncResponse,
+    compile_encoder,
+    get_encoded_response_cache,
+    json_dumps,
+    orjson)
+from utils.metrics import metrics
+from . import admission
+from .analysis_pool import analyze_text_parts_async, shutdown_analysis_pool
+from .async_queries import list_posts_async, post_exists_async, update_post_sync
+from .core import (
+    analyze_text,
+    calculate_parts,
+    divide_text,
+    divide_text_chunks,
+    find_text_split,
+    process_subtext_results)
+from .fields import stored_value
+from .management.commands.benchmark_responses import legacy_response
+from .management.commands.loadtest import Command as LoadtestCommand, latency_summary
+from .models import ANALYSIS_RESPONSE_SHAPE, CorpusStats, Post
+from .stats import compute_corpus_stats, read_corpus_stats, rebuild_corpus_stats, stored_corpus_stats, summarize
+from .uuid_filter import create_post_uuid_filter, load_post_uuid_filter
+from .notifier import notify_analysis_written, wait_for_analysis
+from .write_behind import AnalysisWriteBehind
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+# Tests run without Redis, the uuid filter, the write-behind writer and the
+# read replicas are switched off unless a test is about them.
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'post-tests'}}
+
+
+@override_settings(CACHES=TEST_CACHES, POST_UUID_FILTER=False, ANALYSIS_WRITE_BEHIND=False, DATABASE_REPLICAS=[])
+class PostTestCase(TestCase):
+
+    # Includes the replica of post_analyzer.settings.replica_local when it is configured.
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+
+    def create_post(self, text: str = 'hello there world', **kwargs) -> Post:
+        return Post.objects.create(uuid=uuid.uuid4(), post_description=text, **kwargs)
+
+
+class ImportTimeTests(SimpleTestCase):
+
+    """
+    Guard the cold start of a serving worker.
+
+    A fresh interpreter sets Django up and imports post.views under
+    `python -X importtime`, the same work a worker does before it can serve.
+    Laziness is checked on the imported modules, the time budget only catches
+    gross regressions since CI machines vary a lot in speed.
+    """
+
+    HEAVY_MODULES = ('dask', 'distributed', 'numpy', 'pandas')
+    VIEWS_IMPORT_BUDGET_MS = 3000
+
+    def import_views(self) -> tuple:
+        """
+        :return: Names of the modules imported with post.views and mapping of
+            module name to cumulative import time in microseconds.
+        """
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'post_analyzer.settings.local'),
+                   ANALYSIS_POOL_PREWARM='0')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c',
+             'import sys, json, django; django.setup(); import post.views; print(json.dumps(sorted(sys.modules)))'],
+            cwd=settings.BASE_DIR.parent, env=env, capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+        times = dict()
+        for line in result.stderr.splitlines():
+            match = re.match(r'import time:\s+\d+ \|\s+(\d+) \| +(\S+)$', line)
+            if match:
+                times[match.group(2)] = int(match.group(1))
+        return json.loads(result.stdout.splitlines()[-1]), times
+
+    def test_heavy_modules_are_imported_lazily(self):
+        modules, _ = self.import_views()
+        self.assertIn('post.views', modules)
+        eager = [name for name in modules if name.split('.')[0] in self.HEAVY_MODULES]
+        self.assertEqual(eager, [])
+
+    def test_views_import_within_budget(self):
+        _, times = self.import_views()
+        self.assertLessEqual(times['post.views'] / 1000, self.VIEWS_IMPORT_BUDGET_MS)
+
+
+@override_settings(ANALYSIS_BACKEND='processes', ANALYSIS_POOL_WORKERS=2)
+class AnalysisPoolWarmupTests(SimpleTestCase):
+
+    def setUp(self):
+        from .analysis_pool import shutdown_analysis_pool
+
+        shutdown_analysis_pool()
+        self.addCleanup(shutdown_analysis_pool)
+
+    def test_warm_up_starts_every_pool_process(self):
+        from .analysis_pool import analysis_pool_status, get_analysis_pool, warm_analysis_pool
+
+        warm_analysis_pool()
+        status = analysis_pool_status()
+        self.assertTrue(status['warm'])
+        self.assertEqual(status['workers'], 2)
+        self.assertEqual(len(get_analysis_pool()._processes), 2)
+
+    def test_streamed_parts_are_all_analysed(self):
+        from .analysis_pool import analyze_text_parts
+
+        parts = [' '.join(['word'] * index + ['longerword']) for index in range(1, 31)]
+        expected = process_subtext_results([analyze_text(part) for part in parts])
+        with mock.patch('post.analysis_pool.PARTS_IN_FLIGHT_PER_WORKER', 1):
+            self.assertEqual(analyze_text_parts(iter(parts)), expected)
+
+
+class AnalyzeBacklogTests(PostTestCase):
+
+    @override_settings(MIN_PART_LENGTH=10, MAX_PART_LENGTH=30, MAX_SUPPORTED_LENGTH=50)
+    def test_checkpoint_stops_before_a_failed_post(self):
+        posts = [self.create_post(text) for text in ('one two', 'too long ' * 10, 'three four')]
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = Path(directory) / 'checkpoint.json'
+            output = io.StringIO()
+            call_command('analyze_backlog', workers=1, checkpoint=str(checkpoint), stdout=output)
+
+            self.assertEqual(json.loads(checkpoint.read_text())['last_id'], posts[1].pk - 1)
+            self.assertIn(f'retried by the next run: {posts[1].pk}', output.getvalue())
+        self.assertEqual(list(Post.objects.filter(is_analysed=True).order_by('id').values_list('id', flat=True)),
+                         [posts[0].pk, posts[2].pk])
+
+
+class LifespanTests(SimpleTestCase):
+
+    STARTUP = {'type': 'lifespan.startup'}
+    SHUTDOWN = {'type': 'lifespan.shutdown'}
+
+    async def run_lifespan(self, middleware: LifespanMiddleware, *messages: dict) -> list:
+        received = asyncio.Queue()
+        for message in messages:
+            received.put_nowait(message)
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await middleware({'type': 'lifespan'}, received.get, send)
+        return sent
+
+    def test_startup_runs_the_worker_hooks(self):
+        middleware = LifespanMiddleware(None)
+        with mock.patch('post_analyzer.lifespan.worker_startup') as startup, \
+                mock.patch('post_analyzer.lifespan.worker_shutdown') as shutdown:
+            sent = async_to_sync(self.run_lifespan)(middleware, self.STARTUP, self.SHUTDOWN)
+
+        self.assertEqual(sent, [{'type': 'lifespan.startup.complete'}, {'type': 'lifespan.shutdown.complete'}])
+        startup.assert_called_once_with()
+        shutdown.assert_called_once_with()
+
+    def test_failing_startup_hook_fails_the_startup(self):
+        middleware = LifespanMiddleware(None)
+        with mock.patch('post_analyzer.lifespan.worker_startup', side_effect=RuntimeError('cache down')), \
+                mock.patch('post_analyzer.lifespan.worker_shutdown') as shutdown:
+            sent = async_to_sync(self.run_lifespan)(middleware, self.STARTUP, self.SHUTDOWN)
+
+        self.assertEqual(sent, [{'type': 'lifespan.startup.failed', 'message': 'cache down'}])
+        shutdown.assert_not_called()
+
+    def run_shutdown_with_request_in_flight(self, finish_request: bool) -> list:
+        events = []
+        release = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await release.wait()
+            events.append('request done')
+
+        middleware = LifespanMiddleware(app)
+
+        async def scenario():
+            request = asyncio.ensure_future(middleware({'type': 'http'}, None, None))
+            while not middleware.in_flight:
+                await asyncio.sleep(0)
+            lifespan = asyncio.ensure_future(self.run_lifespan(middleware, self.SHUTDOWN))
+            await asyncio.sleep(0.02)
+            events.append('draining' if not lifespan.done() else 'not drained')
+            if finish_request:
+                release.set()
+            await lifespan
+            request.cancel()
+            await asyncio.gather(request, return_exceptions=True)
+
+        with mock.patch('post.write_behind.get_write_behind') as get_write_behind, \
+                mock.patch('post.analysis_pool.shutdown_analysis_pool') as shutdown_analysis_pool:
+            get_write_behind.return_value.stop.side_effect = lambda: events.append('write-behind flushed')
+            shutdown_analysis_pool.side_effect = lambda wait: events.append('pool stopped')
+            async_to_sync(scenario)()
+        shutdown_analysis_pool.assert_called_once_with(wait=True)
+        return events
+
+    @override_settings(ASGI_DRAIN_TIMEOUT=5)
+    def test_shutdown_waits_for_in_flight_requests(self):
+        self.assertEqual(self.run_shutdown_with_request_in_flight(finish_request=True),
+                         ['draining', 'request done', 'write-behind flushed', 'pool stopped'])
+
+    @override_settings(ASGI_DRAIN_TIMEOUT=0.1)
+    def test_shutdown_stops_waiting_after_the_drain_timeout(self):
+        started = time.monotonic()
+        self.assertEqual(self.run_shutdown_with_request_in_flight(finish_request=False),
+                         ['draining', 'write-behind flushed', 'pool stopped'])
+        self.assertLess(time.monotonic() - started, 5)
+
+
+class WriteBehindTests(SimpleTestCase):
+
+    def recording_writer(self, **kwargs) -> tuple:
+        writer = AnalysisWriteBehind(**kwargs)
+        batches = []
+        writer._flush_batch = lambda batch: batch and batches.append([item[0] for item in batch])
+        return writer, batches
+
+    def test_results_are_written_in_batches(self):
+        writer, batches = self.recording_writer(batch_size=2, flush_interval_ms=200)
+        for post_id in 'abcde':
+            self.assertTrue(writer.enqueue(post_id, {}, None))
+        writer.stop()
+        self.assertEqual(batches, [['a', 'b'], ['c', 'd'], ['e']])
+
+    def test_stop_flushes_the_queue_and_rejects_new_results(self):
+        writer, batches = self.recording_writer(batch_size=100, flush_interval_ms=100)
+        for post_id in 'abc':
+            writer.enqueue(post_id, {}, None)
+        writer.stop()
+        self.assertEqual(sum(batches, []), ['a', 'b', 'c'])
+        self.assertFalse(writer.enqueue('d', {}, None))
+
+    def test_stop_leaves_a_busy_writer_alone(self):
+        writer = AnalysisWriteBehind(batch_size=1, flush_interval_ms=10)
+        release, flushed_by = threading.Event(), []
+
+        def slow_flush(batch):
+            flushed_by.append(threading.current_thread().name)
+            release.wait(5)
+        writer._flush_batch = slow_flush
+
+        writer.enqueue('a', {}, None)
+        writer.enqueue('b', {}, None)
+        while not flushed_by:
+            threading.Event().wait(0.01)
+        writer.stop(timeout=0.1)
+        release.set()
+        writer._thread.join(5)
+        self.assertEqual(set(flushed_by), {'analysis-write-behind'})
+        self.assertEqual(len(flushed_by), 2)
+
+
+class WriteBehindFlushTests(PostTestCase):
+
+    def test_flush_writes_every_post_with_one_update(self):
+        posts = [self.create_post() for _ in range(3)]
+        analysed_at = timezone.now()
+        writer = AnalysisWriteBehind(batch_size=10, flush_interval_ms=10)
+        with CaptureQueriesContext(connection) as queries:
+            writer._flush_batch([
+                (str(posts[0].uuid), {'total_words': 1, 'average_word_length': 1.0}, analysed_at),
+                (str(posts[1].uuid), {'total_words': 2, 'average_word_length': 2.0}, analysed_at),
+                (str(posts[1].uuid), {'total_words': 5, 'average_word_length': 3.5}, analysed_at),
+            ])
+        post_updates = [query for query in queries if query['sql'].startswith('UPDATE "post_post"')]
+        self.assertEqual(len(post_updates), 1)
+        self.assertIn('CASE WHEN', post_updates[0]['sql'])
+
+        rows = {row[0]: row[1:] for row in Post.objects.values_list('uuid', 'is_analysed', 'total_words', 'average_word_length')}
+        self.assertEqual(rows[posts[0].uuid], (True, 1, 1.0))
+        self.assertEqual(rows[posts[1].uuid], (True, 5, 3.5))
+        self.assertEqual(rows[posts[2].uuid], (False, 0, 0.0))
+
+
+@skipUnless('replica' in settings.DATABASES, 'needs the replica alias, run with --settings post_analyzer.settings.replica_local')
+@override_settings(DATABASE_REPLICAS=['replica'])
+class PrimaryReplicaRouterTests(PostTestCase):
+
+    # Nothing replicates between the two test databases, a post is only
+    # found where it was written.
+
+    def test_reads_go_to_the_replica_and_writes_to_the_primary(self):
+        post = self.create_post()
+        self.assertEqual(router.db_for_write(Post), 'default')
+        self.assertTrue(Post.objects.using('default').filter(pk=post.pk).exists())
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+        self.assertFalse(Post.objects.using(read_database_for_post(post.uuid)).filter(pk=post.pk).exists())
+
+    def test_reads_right_after_a_write_go_to_the_primary(self):
+        post = self.create_post()
+        pin_post_to_primary(post.uuid)
+        self.assertTrue(Post.objects.using(read_database_for_post(post.uuid)).filter(pk=post.pk).exists())
+        self.assertEqual(read_database_for_post(uuid.uuid4()), 'replica')
+
+        cache.delete(replica_pin_cache_key(post.uuid))
+        self.assertEqual(read_database_for_post(post.uuid), 'replica')
+
+    def test_write_behind_flush_pins_the_posts(self):
+        post = self.create_post()
+        AnalysisWriteBehind(batch_size=10, flush_interval_ms=10)._flush_batch(
+            [(str(post.uuid), {'total_words': 1, 'average_word_length': 1.0}, timezone.now())])
+        self.assertEqual(read_database_for_post(post.uuid), 'default')
+
+    def test_corpus_stats_are_verified_and_rebuilt_on_the_primary(self):
+        self.create_post(is_analysed=True, total_words=4, average_word_length=2.5)
+        self.create_post()
+
+        self.assertEqual(compute_corpus_stats()['total_posts'], 2)
+        self.assertEqual(stored_corpus_stats()['total_posts'], 2)
+        call_command('corpus_stats', stdout=io.StringIO())
+
+        self.assertEqual(rebuild_corpus_stats(), dict(total_posts=2, analysed_posts=1, total_words=4, total_word_length=10.0))
+        self.assertEqual(CorpusStats.objects.using('default').get(shard=0).total_posts, 2)
+        self.assertFalse(CorpusStats.objects.using('replica').filter(total_posts__gt=0).exists())
+
+
+class AnalysisCacheTests(PostTestCase):
+
+    def cache_response(self, post: Post) -> None:
+        cache_analysis_response(post.uuid, HttpResponse(str(post.uuid)))
+
+    def test_invalidate_command_drops_every_cached_analysis(self):
+        posts = [self.create_post() for _ in range(2)]
+        for post in posts:
+            self.cache_response(post)
+        version = analysis_cache_version()
+
+        call_command('invalidate_analysis_cache', stdout=io.StringIO())
+
+        self.assertGreater(analysis_cache_version(), version)
+        for post in posts:
+            self.assertIsNone(get_cached_analysis_response(post.uuid))
+
+    def test_an_evicted_version_never_reads_old_entries_again(self):
+        post = self.create_post()
+        cache.set(ANALYSIS_CACHE_VERSION_KEY, 1, None)
+        self.cache_response(post)
+
+        cache.delete(ANALYSIS_CACHE_VERSION_KEY)
+
+        self.assertGreater(analysis_cache_version(), 1)
+        self.assertIsNone(get_cached_analysis_response(post.uuid))
+
+    def test_saving_or_deleting_a_post_drops_its_cached_analysis(self):
+        post = self.create_post()
+        self.cache_response(post)
+        post.save()
+        self.assertIsNone(get_cached_analysis_response(post.uuid))
+
+        self.cache_response(post)
+        post_id = post.uuid
+        post.delete()
+        self.assertIsNone(get_cached_analysis_response(post_id))
+
+    def test_writing_an_analysis_caches_its_response(self):
+        async def write_analysis(post_id, response=None):
+            await update_post_sync(post_id, {'total_words': 3, 'average_word_length': 4.0}, response)
+
+        post = self.create_post()
+        async_to_sync(write_analysis)(str(post.uuid), HttpResponse('written'))
+        self.assertEqual(get_cached_analysis_response(post.uuid).content, b'written')
+
+        async_to_sync(write_analysis)(str(post.uuid))
+        self.assertIsNone(get_cached_analysis_response(post.uuid))
+
+
+@override_settings(ANALYSIS_BACKEND='processes', ANALYSIS_POOL_WORKERS=1)
+class AnalysisViewTests(PostTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(shutdown_analysis_pool)
+        get_encoded_response_cache().clear()
+
+    def analysis_url(self, post: Post) -> str:
+        return f'/api/v1/post/{post.uuid}/analyze'
+
+    def test_cold_and_stored_analyses_send_the_same_body_and_etag(self):
+        post = self.create_post('one two three four')
+        cold = self.client.get(self.analysis_url(post))
+        self.assertEqual(cold.status_code, 200)
+
+        cache.clear()
+        get_encoded_response_cache().clear()
+        stored = self.client.get(self.analysis_url(post))
+
+        self.assertEqual(stored.content, cold.content)
+        self.assertEqual(stored['ETag'], cold['ETag'])
+        self.assertEqual(json.loads(cold.content)['data']['analysis'], {'total_words': 4, 'average_word_length': 3.75})
+
+    def test_if_none_match_answers_304_without_a_body(self):
+        post = self.create_post('one two three four')
+        etag = self.client.get(self.analysis_url(post))['ETag']
+
+        for cached in (True, False):
+            if not cached:
+                cache.clear()
+            response = self.client.get(self.analysis_url(post), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get(self.analysis_url(post), HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_admission_rejections_answer_with_retry_after(self):
+        self.addCleanup(setattr, admission, '_admission_controller', None)
+        post = self.create_post('one two three four')
+        cases = [
+            (admission.AdmissionController(1, 10 ** 9, 0, 5, retry_after=7), 429, 'PO429', '7'),
+            (admission.AdmissionController(1, 10 ** 9, 5, 0.01, retry_after=2), 503, 'PO503', '2'),
+        ]
+        for controller, status_code, error_code, retry_after in cases:
+            with self.subTest(status_code=status_code):
+                # One analysis already holds the only slot.
+                controller.running = 1
+                admission._admission_controller = controller
+
+                response = self.client.get(self.analysis_url(post))
+                self.assertEqual(response.status_code, status_code)
+                self.assertEqual(response['Retry-After'], retry_after)
+                self.assertEqual(json.loads(response.content)['error_code'], error_code)
+                self.assertEqual(controller.waiting, 0)
+
+        admission._admission_controller = None
+        response = self.client.get(self.analysis_url(post))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Retry-After'))
+
+    def test_x_cache_header_tells_cached_responses_apart(self):
+        post = self.create_post('one two three four')
+        self.assertEqual(self.client.get(self.analysis_url(post))['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.analysis_url(post))['X-Cache'], 'HIT')
+
+        cache.clear()
+        self.assertEqual(self.client.get(self.analysis_url(post))['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.analysis_url(post))['X-Cache'], 'HIT')
+
+        missing = Post(uuid=uuid.uuid4())
+        for _ in range(2):
+            response = self.client.get(self.analysis_url(missing))
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response['X-Cache'], 'MISS')
+
+
+class AdmissionLimitsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, admission, '_admission_controller', None)
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_full_queue_rejects_with_429(self):
+        controller = admission.AdmissionController(1, 100, 1, 5, retry_after=7)
+
+        async def scenario():
+            await controller.acquire(10)
+            waiter = asyncio.ensure_future(controller.acquire(10))
+            while controller.waiting < 1:
+                await asyncio.sleep(0)
+            queue_depth = metrics.snapshot()['gauges']['admission.queue_depth']
+
+            with self.assertRaises(ServiceException) as rejected:
+                await controller.acquire(10)
+
+            await controller.release(10)
+            await waiter
+            await controller.release(10)
+            return queue_depth, rejected.exception
+
+        queue_depth, rejected = async_to_sync(scenario)()
+        self.assertEqual(queue_depth, 1)
+        self.assertEqual((rejected.status_code, rejected.error_code, rejected.rest_obj), (429, 'PO429', {'retry_after': 7}))
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['counters']['admission.rejected_queue_full'], 1)
+        self.assertEqual(snapshot['counters']['admission.admitted'], 2)
+        self.assertEqual(snapshot['gauges']['admission.queue_depth'], 0)
+        self.assertEqual((controller.running, controller.memory_in_use, controller.waiting), (0, 0, 0))
+
+    def test_waiting_past_the_deadline_answers_503(self):
+        controller = admission.AdmissionController(1, 100, 5, 0.05, retry_after=3)
+
+        async def scenario():
+            await controller.acquire(10)
+            try:
+                await controller.acquire(10)
+            finally:
+                await controller.release(10)
+
+        started = time.monotonic()
+        with self.assertRaises(ServiceException) as rejected:
+            async_to_sync(scenario)()
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertEqual((rejected.exception.status_code, rejected.exception.error_code, rejected.exception.rest_obj),
+                         (503, 'PO503', {'retry_after': 3}))
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['counters']['admission.rejected_timeout'], 1)
+        self.assertEqual(snapshot['summaries']['admission.wait_ms']['count'], 1)
+        self.assertEqual(snapshot['gauges']['admission.queue_depth'], 0)
+        self.assertEqual(controller.waiting, 0)
+
+    def test_memory_budget_queues_analyses_that_do_not_fit(self):
+        controller = admission.AdmissionController(4, 100, 5, 5, retry_after=1)
+
+        async def scenario():
+            await controller.acquire(60)
+            waiter = asyncio.ensure_future(controller.acquire(60))
+            while controller.waiting < 1:
+                await asyncio.sleep(0)
+            admitted_while_full = controller.running
+            await controller.release(60)
+            await waiter
+            return admitted_while_full
+
+        self.assertEqual(async_to_sync(scenario)(), 1)
+        self.assertEqual((controller.running, controller.memory_in_use), (1, 60))
+
+    @override_settings(WEB_CONCURRENCY=4, ANALYSIS_MAX_CONCURRENCY=8, ANALYSIS_MEMORY_BUDGET_BYTES=400)
+    def test_each_worker_enforces_its_share_of_the_host_limits(self):
+        admission._admission_controller = None
+        controller = admission.get_admission_controller()
+        self.assertEqual(controller.max_concurrency, 2)
+        self.assertEqual(controller.memory_budget, 100)
+
+    @override_settings(WEB_CONCURRENCY=8, ANALYSIS_MAX_CONCURRENCY=4)
+    def test_every_worker_can_run_one_analysis(self):
+        admission._admission_controller = None
+        self.assertEqual(admission.get_admission_controller().max_concurrency, 1)
+
+
+class PostListTests(PostTestCase):
+
+    def list_pages(self, query: str = '') -> list:
+        pages, cursor = [], ''
+        while True:
+            response = self.client.get(f'/api/v1/post/?limit=4{query}{cursor}')
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.content)['data']
+            pages.append([post['uuid'] for post in data['posts']])
+            if data['next_cursor'] is None:
+                return pages
+            cursor = f'&cursor={data["next_cursor"]}'
+
+    def test_pages_list_every_post_once_in_creation_order(self):
+        posts = [self.create_post(is_analysed=index % 2 == 0) for index in range(10)]
+        # Ties on created_at are broken by id.
+        Post.objects.filter(pk__in=[post.pk for post in posts[3:6]]).update(created_at=posts[3].created_at)
+
+        pages = self.list_pages()
+        self.assertEqual([len(page) for page in pages], [4, 4, 2])
+        self.assertEqual(sum(pages, []), [str(post.uuid) for post in posts])
+
+        analysed = sum(self.list_pages('&is_analysed=true'), [])
+        self.assertEqual(analysed, [str(post.uuid) for post in posts[::2]])
+
+    @skipUnless(connection.vendor == 'sqlite', 'reads the SQLite query plan and VM step counts')
+    def test_page_cost_does_not_grow_with_depth(self):
+        Post.objects.bulk_create([Post(uuid=uuid.uuid4(), is_analysed=index % 2 == 0) for index in range(3000)])
+        keys = list(Post.objects.order_by('created_at', 'id').values_list('created_at', 'id'))
+
+        def read_page(after, **filters) -> int:
+            steps = [0]
+
+            def count_step():
+                steps[0] += 1
+
+            connection.ensure_connection()
+            connection.connection.set_progress_handler(count_step, 1)
+            try:
+                async_to_sync(list_page)(filters, after, 10)
+            finally:
+                connection.connection.set_progress_handler(None, 1)
+            return steps[0]
+
+        async def list_page(filters, after, limit):
+            return await list_posts_async(filters, after, limit)
+
+        for filters in ({}, {'is_analysed': True}):
+            shallow, deep = read_page(keys[10], **filters), read_page(keys[-30], **filters)
+            self.assertLess(deep, shallow * 1.5, filters)
+
+        with CaptureQueriesContext(connection) as queries:
+            async_to_sync(list_page)({}, keys[-30], 10)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + queries[-1]['sql'])
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('SEARCH', plan)
+        self.assertIn('post_created_id_idx', plan)
+
+
+class CorpusStatsTests(PostTestCase):
+
+    def analyse(self, post: Post, total_words: int, average_word_length: float) -> None:
+        async def write_analysis():
+            await update_post_sync(str(post.uuid), {'total_words': total_words, 'average_word_length': average_word_length})
+
+        async_to_sync(write_analysis)()
+
+    def test_counters_follow_post_writes_across_shards(self):
+        posts = [self.create_post() for _ in range(40)]
+        self.analyse(posts[0], 10, 4.0)
+        self.analyse(posts[1], 30, 2.0)
+        self.analyse(posts[1], 20, 5.0)
+        posts[2].delete()
+
+        self.assertGreater(CorpusStats.objects.count(), 1)
+        self.assertLessEqual(CorpusStats.objects.count(), settings.CORPUS_STATS_SHARDS)
+        self.assertEqual(read_corpus_stats(), summarize(compute_corpus_stats()))
+        self.assertEqual(read_corpus_stats(), {
+            'total_posts': 39, 'analysed_posts': 2, 'backlog': 37, 'total_words': 30, 'average_word_length': 4.67})
+
+    def test_command_reports_drift_and_rebuilds(self):
+        for _ in range(5):
+            self.create_post()
+        CorpusStats.objects.create(shard=settings.CORPUS_STATS_SHARDS, total_posts=3)
+
+        with self.assertRaises(CommandError):
+            call_command('corpus_stats', stdout=io.StringIO())
+        call_command('corpus_stats', '--fix', stdout=io.StringIO())
+
+        call_command('corpus_stats', stdout=io.StringIO())
+        self.assertEqual(read_corpus_stats()['total_posts'], 5)
+        self.assertEqual(set(CorpusStats.objects.exclude(total_posts=0).values_list('shard', flat=True)), {0})
+        self.assertFalse(CorpusStats.objects.filter(shard__gte=settings.CORPUS_STATS_SHARDS).exists())
+
+
+@override_settings(ANALYSIS_BACKEND='distributed', ANALYSIS_POOL_WORKERS=1)
+class AnalysisBackendFallbackTests(SimpleTestCase):
+
+    def setUp(self):
+        self.addCleanup(shutdown_analysis_pool)
+
+    def analyze(self, failure: Exception) -> tuple:
+        """
+        :return: Result of analysing two parts when the cluster raises failure,
+            and the threads the parts were produced on.
+        """
+        threads = []
+
+        def text_parts():
+            for part in ('one two', 'three four five'):
+                threads.append(threading.current_thread())
+                yield part
+
+        async def analyze_on_cluster(client, parts):
+            self.assertEqual(parts, ['one two', 'three four five'])
+            raise failure
+
+        with mock.patch('post.analysis_pool.get_distributed_client', return_value=object()), \
+                mock.patch('post.analysis_pool.analyze_on_cluster', analyze_on_cluster):
+            result = async_to_sync(analyze_text_parts_async)(text_parts())
+        return result, threads
+
+    def test_cluster_failures_fall_back_to_the_local_pool(self):
+        from distributed import KilledWorker
+        from distributed.comm import CommClosedError
+
+        for failure in (KilledWorker('part', mock.Mock(address='tcp://worker:1'), 3), CancelledError('part'), CommClosedError('gone'), TimeoutError()):
+            result, threads = self.analyze(failure)
+            self.assertEqual(result, {'total_words': 5, 'average_word_length': 3.8})
+            self.assertNotIn(threading.main_thread(), threads)
+
+    def test_analysis_errors_are_not_retried_locally(self):
+        with self.assertRaises(ValueError):
+            self.analyze(ValueError('bad part'))
+
+
+class BloomFilterTests(SimpleTestCase):
+
+    def check_filter(self, bloom) -> None:
+        items = [f'post-{index}' for index in range(650)]
+        bloom.add_many(items[:300])
+        for item in items[300:]:
+            bloom.add(item)
+
+        self.assertTrue(all(item in bloom for item in items))
+        stats = bloom.stats()
+        # Items whose bits were all set already are not counted.
+        self.assertGreater(stats['items'], 640)
+        self.assertLessEqual(stats['items'], 650)
+        # Layers of 100, 200 and 400 items, the newest is not full yet.
+        self.assertEqual([layer['capacity'] for layer in stats['layers']], [100, 200, 400])
+        self.assertLess(stats['estimated_false_positive_rate'], 0.01 / (1 - 0.5))
+        false_positives = sum(f'other-{index}' in bloom for index in range(5000))
+        self.assertLess(false_positives / 5000, 0.01 / (1 - 0.5))
+
+    def test_local_filter_scales_without_false_negatives(self):
+        self.check_filter(LocalScalableBloomFilter(capacity=100, error_rate=0.01))
+
+    @skipUnless(fakeredis is not None, 'needs the fakeredis package')
+    def test_redis_filter_scales_without_false_negatives(self):
+        client = fakeredis.FakeStrictRedis()
+        bloom = RedisScalableBloomFilter(client, 'test', capacity=100, error_rate=0.01)
+        self.check_filter(bloom)
+
+        # Another process still only knows the first layer.
+        stale = RedisScalableBloomFilter(client, 'test', capacity=100, error_rate=0.01)
+        self.assertIsNone(stale.lookup(str(uuid.uuid4())))
+        bloom.mark_ready()
+        item = str(uuid.uuid4())
+        stale.add(item)
+        self.assertTrue(bloom.lookup(item))
+        self.assertEqual(stale.layer_count, 3)
+
+        bloom.clear()
+        self.assertEqual(client.keys('bloom:*'), [])
+
+
+@override_settings(POST_UUID_FILTER=True)
+class PostUuidFilterTests(PostTestCase):
+
+    def test_rebuild_command_loads_every_post_uuid(self):
+        posts = [self.create_post() for _ in range(5)]
+        out = io.StringIO()
+        call_command('rebuild_post_uuid_filter', '--chunk-size', '2', stdout=out)
+
+        self.assertIn('Added 5 post uuids', out.getvalue())
+        stats = json.loads(out.getvalue()[out.getvalue().index('{'):])
+        self.assertEqual(stats['items'], 5)
+
+        bloom = create_post_uuid_filter()
+        load_post_uuid_filter(bloom)
+        self.assertTrue(all(bloom.lookup(str(post.uuid)) for post in posts))
+
+    def test_duplicate_missed_by_the_filter_is_a_409_duplication(self):
+        post = self.create_post()
+        with mock.patch('post.views.post_uuid_might_exist', return_value=False):
+            response = self.client.post('/api/v1/post/', {'uuid': str(post.uuid), 'post_description': 'again'},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.content)['error_code'], 'PO400')
+
+
+class LongPollTests(PostTestCase):
+
+    def test_waiters_wake_on_notify_and_time_out_without_one(self):
+        post_id = str(uuid.uuid4())
+
+        async def wait(timeout):
+            return await wait_for_analysis(post_id, timeout)
+
+        self.assertIsNone(async_to_sync(wait)(5))
+
+        mark_analysis_in_progress(post_id)
+        started = time.monotonic()
+        self.assertFalse(async_to_sync(wait)(0.2))
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+        notifier = threading.Timer(0.2, notify_analysis_written, args=(post_id.upper(),))
+        notifier.start()
+        started = time.monotonic()
+        self.assertTrue(async_to_sync(wait)(10))
+        self.assertLess(time.monotonic() - started, 5)
+        notifier.join()
+
+    @override_settings(ANALYSIS_BACKEND='processes', ANALYSIS_POOL_WORKERS=1)
+    def test_a_cold_analysis_notifies_once(self):
+        self.addCleanup(shutdown_analysis_pool)
+        post = self.create_post('one two three four')
+        for write_behind in (False, True):
+            # The queued write is dropped, only the notifications matter here.
+            with self.subTest(write_behind=write_behind), override_settings(ANALYSIS_WRITE_BEHIND=write_behind), \
+                    mock.patch('post.async_queries.get_write_behind') as get_writer, \
+                    mock.patch('post.notifier.AnalysisNotifier.publish') as publish:
+                get_writer.return_value.enqueue.return_value = True
+                Post.objects.filter(pk=post.pk).update(is_analysed=False)
+                cache.clear()
+                response = self.client.get(f'/api/v1/post/{post.uuid}/analyze')
+                self.assertEqual(response.status_code, 200)
+                publish.assert_called_once_with(str(post.uuid))
+
+    def test_wait_answers_202_while_another_request_analyses(self):
+        post = self.create_post()
+        mark_analysis_in_progress(str(post.uuid))
+        response = self.client.get(f'/api/v1/post/{post.uuid}/analyze?wait=0.2')
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(json.loads(response.content)['data']['is_analysed'])
+
+
+def whole_text_parts(text: str) -> list:
+    """
+    Parts of divide_text as it cut a whole text before texts were streamed.
+    """
+    parts, remaining_text = [], text
+    number_of_parts = calculate_parts(len(text))
+    part_length = len(text) // number_of_parts
+    for _ in range(number_of_parts - 1):
+        split_point = find_text_split(remaining_text, part_length)
+        if split_point > 0:
+            parts.append(remaining_text[:split_point].rstrip())
+            remaining_text = remaining_text[split_point:].lstrip()
+    if remaining_text:
+        parts.append(remaining_text)
+    return parts
+
+
+@override_settings(MIN_PART_LENGTH=20, MAX_PART_LENGTH=60, MAX_SUPPORTED_LENGTH=5000)
+class TextStorageTests(PostTestCase):
+
+    def test_divided_chunks_match_the_whole_text_division(self):
+        generator = random.Random(0)
+        for _ in range(500):
+            words = [''.join(generator.choices('abcdé', k=generator.randint(1, 15))) for _ in range(generator.randint(0, 120))]
+            text = ''.join(word + generator.choice([' ', '  ', '\n', ' \n ']) for word in words).strip(generator.choice(['', ' ']))
+            cut, chunks = 0, []
+            while cut < len(text):
+                step = generator.randint(1, 50)
+                chunks.append(text[cut:cut + step])
+                cut += step
+            self.assertEqual(list(divide_text_chunks(iter(chunks), len(text))), whole_text_parts(text), text)
+            self.assertEqual(list(divide_text(text)), whole_text_parts(text), text)
+
+            stored = compress_text(text, 'zlib')
+            self.assertEqual(list(divide_text_chunks(iter_stored_text(stored, chunk_size=7), stored_text_length(stored))),
+                             whole_text_parts(text), text)
+
+    def test_compressed_field_round_trip(self):
+        texts = ['short', 'ünïcödé wörds ' * 200, ' '.join(str(index) for index in range(2000)), '']
+        for codec in available_codecs():
+            with self.subTest(codec=codec), override_settings(POST_TEXT_COMPRESSION=codec, POST_TEXT_COMPRESSION_THRESHOLD=100):
+                for text in texts:
+                    post = self.create_post(text)
+                    post.refresh_from_db()
+                    self.assertEqual(post.post_description, text)
+
+                    stored = bytes(Post.objects.values_list(stored_value('post_description'), flat=True).get(pk=post.pk))
+                    self.assertEqual(stored_text_codec(stored), 'none' if len(text.encode()) < 100 else codec)
+                    self.assertEqual(stored_text_length(stored), len(text))
+                    self.assertEqual(''.join(iter_stored_text(stored, chunk_size=64)), text)
+
+        post = self.create_post(None)
+        post.refresh_from_db()
+        self.assertIsNone(post.post_description)
+
+    def test_existence_check_does_not_read_the_text(self):
+        post = self.create_post('some words ' * 500)
+
+        async def exists(post_id):
+            return await post_exists_async(post_id)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(async_to_sync(exists)(post.uuid), post)
+            self.assertIsNone(async_to_sync(exists)(uuid.uuid4()))
+        self.assertNotIn('post_description', ' '.join(query['sql'] for query in queries.captured_queries))
+
+    def test_text_that_does_not_shrink_is_stored_raw(self):
+        text = ''.join(random.Random(0).choices(string.printable, k=40))
+        for codec in available_codecs():
+            stored = compress_text(text, codec)
+            self.assertEqual(stored_text_codec(stored), 'none')
+            self.assertEqual(decompress_text(stored), text)
+
+
+@override_settings(CACHES=TEST_CACHES, POST_UUID_FILTER=False, ANALYSIS_WRITE_BEHIND=False, DATABASE_REPLICAS=[],
+                   ANALYSIS_BACKEND='processes', ANALYSIS_POOL_WORKERS=1)
+class TextStorageMigrationTests(TransactionTestCase):
+
+    BEFORE_COMPRESSION = [('post', '0004_corpusstats')]
+
+    def setUp(self):
+        cache.clear()
+        get_encoded_response_cache().clear()
+        self.addCleanup(shutdown_analysis_pool)
+        self.addCleanup(self.migrate, MigrationExecutor(connection).loader.graph.leaf_nodes('post'))
+
+    def migrate(self, targets: list):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_plain_text_rows_are_converted_and_analysed(self):
+        legacy_post = self.migrate(self.BEFORE_COMPRESSION).get_model('post', 'Post')
+        texts = {uuid.uuid4(): 'legacy text of a post', uuid.uuid4(): 'ünïcödé wörds ' * 200, uuid.uuid4(): None}
+        for post_uuid, text in texts.items():
+            legacy_post.objects.create(uuid=post_uuid, post_description=text)
+
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('post'))
+
+        for post_uuid, text in texts.items():
+            post = Post.objects.get(uuid=post_uuid)
+            self.assertEqual(post.post_description, text)
+            if text is not None:
+                stored = bytes(Post.objects.values_list(stored_value('post_description'), flat=True).get(pk=post.pk))
+                self.assertEqual(stored_text_length(stored), len(text))
+
+        post_uuid = next(iter(texts))
+        response = self.client.get(f'/api/v1/post/{post_uuid}/analyze')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['data']['analysis'], {'total_words': 5, 'average_word_length': 3.4})
+
+
+@override_settings(CACHES=TEST_CACHES, POST_UUID_FILTER=False, ANALYSIS_WRITE_BEHIND=False, DATABASE_REPLICAS=[],
+                   ANALYSIS_BACKEND='processes', ANALYSIS_POOL_WORKERS=1)
+class LoadtestCommandTests(TransactionTestCase):
+
+    # The in-process run serves the requests from other threads, they have
+    # to see each other's committed posts. The in-memory test database
+    # answers concurrent writers with 'table is locked' instead of waiting,
+    # so the run sends one request at a time.
+
+    REPORT_KEYS = {'target', 'python', 'duration_s', 'concurrency', 'target_rps', 'mix', 'post_size', 'requests',
+                   'throughput_rps', 'error_rate', 'cache_hit_ratio', 'latency_ms', 'operations'}
+    OPERATION_KEYS = {'requests', 'throughput_rps', 'error_rate', 'status_codes', 'latency_ms'}
+
+    def setUp(self):
+        cache.clear()
+        get_encoded_response_cache().clear()
+        self.addCleanup(shutdown_analysis_pool)
+        self.addCleanup(setattr, admission, '_admission_controller', None)
+
+    def test_in_process_run_reports_latencies_errors_and_cache_hits(self):
+        out = io.StringIO()
+        call_command('loadtest', '--duration', '0.5', '--seed-posts', '5', '--seed-analysed', '0.6',
+                     '--concurrency', '1', '--mix', 'create=1, cold=1 ,cached=3', '--size-distribution', 'fixed',
+                     '--size-mean', '200', '--random-seed', '1', stdout=out, stderr=io.StringIO())
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(set(report), self.REPORT_KEYS)
+        self.assertEqual(report['target'], 'in-process ASGI')
+        self.assertEqual(report['mix'], {'create': 1.0, 'cold': 1.0, 'cached': 3.0})
+        self.assertEqual(report['requests'], sum(figures['requests'] for figures in report['operations'].values()))
+        self.assertGreater(report['requests'], 0)
+        self.assertEqual(report['error_rate'], 0)
+        for operation, figures in report['operations'].items():
+            self.assertEqual(set(figures), self.OPERATION_KEYS, operation)
+            self.assertEqual(figures['error_rate'], 0, operation)
+            self.assertEqual(set(figures['status_codes']), {'201' if operation == 'create' else '200'} if figures['requests'] else set())
+
+        self.assertGreater(report['operations']['cached']['requests'], 0)
+        self.assertGreater(report['cache_hit_ratio'], 0)
+        latency = report['latency_ms']
+        self.assertLessEqual(latency['p50'], latency['p95'])
+        self.assertLessEqual(latency['p95'], latency['p99'])
+        self.assertLessEqual(latency['p99'], latency['max'])
+        self.assertGreaterEqual(Post.objects.filter(is_analysed=True).count(), 3)
+
+    def test_report_counts_errors_and_cache_hits(self):
+        command = LoadtestCommand()
+        command.options = {'url': None, 'concurrency': 4, 'rps': 0, 'size_distribution': 'fixed', 'size_mean': 10}
+        command.mix, command.size_max = {'create': 1.0, 'cached': 1.0}, 100
+        latencies = {'create': [5.0, 1.0, 3.0, 2.0], 'cold': [], 'cached': [float(value) for value in range(100, 0, -1)]}
+        statuses = {'create': {'201': 3, '500': 1}, 'cold': {}, 'cached': {'200': 98, '503': 1, 'TimeoutError': 1}}
+
+        report = command.report(latencies, statuses, {'HIT': 3, 'MISS': 1}, elapsed=2)
+
+        self.assertEqual(report['requests'], 104)
+        self.assertEqual(report['throughput_rps'], 52)
+        self.assertEqual(report['error_rate'], round(3 / 104, 4))
+        self.assertEqual(report['cache_hit_ratio'], 0.75)
+        self.assertEqual(report['operations']['create']['error_rate'], 0.25)
+        self.assertEqual(report['operations']['cached']['error_rate'], 0.02)
+        self.assertEqual(report['operations']['cold'], {'requests': 0, 'throughput_rps': 0, 'error_rate': 0, 'status_codes': {},
+                                                        'latency_ms': {'p50': None, 'p95': None, 'p99': None, 'max': None}})
+        self.assertEqual(report['operations']['cached']['latency_ms'], {'p50': 50, 'p95': 95, 'p99': 99, 'max': 100})
+        self.assertEqual(report['operations']['create']['latency_ms'], {'p50': 2, 'p95': 5, 'p99': 5, 'max': 5})
+        self.assertIsNone(command.report(latencies, {'create': {}, 'cold': {}, 'cached': {}},
+                                         {'HIT': 0, 'MISS': 0}, elapsed=1)['cache_hit_ratio'])
+        self.assertEqual(latency_summary([7.12345]), {'p50': 7.123, 'p95': 7.123, 'p99': 7.123, 'max': 7.123})
+
+    def test_invalid_mix_is_rejected(self):
+        for mix in ['create=1,bogus=2', 'create=x', 'create', 'create=0,cold=0', 'cold=-1,create=2', '']:
+            with self.subTest(mix=mix), self.assertRaises(CommandError):
+                call_command('loadtest', '--mix', mix, stdout=io.StringIO(), stderr=io.StringIO())
+
+
+class ResponseEncodingTests(SimpleTestCase):
+
+    BACKENDS = ['json'] + (['orjson'] if orjson is not None else [])
+
+    def response_cases(self) -> list:
+        now = timezone.now()
+        post = Post(uuid=uuid.uuid4(), is_analysed=True, created_at=now, analysed_at=now,
+                    total_words=12, average_word_length=4.25)
+        return [
+            (200, post.analysis_response, 'Fetched analysis successfully', None),
+            (200, dict(posts=[ResponseSerializer.serialize({'uuid': post.uuid, 'created_at': now, 'analysed_at': None})],
+                       next_cursor=None), 'Fetched posts successfully', None),
+            (200, {'at': datetime.time(10, 5, 3, 123456), 'on': datetime.date(2024, 1, 2), 'when': now,
+                   'took': datetime.timedelta(seconds=5), 'price': Decimal('1.50'), 'tags': {'a'},
+                   'label': gettext_lazy('label'), 'nested': {'at': datetime.time(1, 2), 'id': post.uuid}}, 'Mixed', None),
+            (404, None, 'Post does not exist', 'PO404'),
+            (500, None, 'Boom', 500),
+        ]
+
+    def test_responses_match_the_legacy_serializer(self):
+        for backend in self.BACKENDS:
+            with override_settings(RESPONSE_JSON_BACKEND=backend):
+                for status_code, data, message, error_code in self.response_cases():
+                    with self.subTest(backend=backend, message=message):
+                        response = SendAsyncResponse(status_code, data, message, error_code)
+                        legacy = legacy_response(status_code, data, message, error_code)
+                        self.assertEqual(response.status_code, legacy.status_code)
+                        self.assertEqual(response['Content-Type'], legacy['Content-Type'])
+                        self.assertEqual(json.loads(response.content), json.loads(legacy.content))
+
+    def test_compiled_encoders_match_plain_encoding(self):
+        for backend in self.BACKENDS:
+            encode = compile_encoder(ANALYSIS_RESPONSE_SHAPE, backend)
+            for post in (Post(uuid=uuid.uuid4(), is_analysed=True, total_words=3, average_word_length=1 / 3),
+                         Post(uuid=uuid.uuid4(), total_words=None, average_word_length=0.0)):
+                with self.subTest(backend=backend):
+                    self.assertEqual(json.loads(encode(post.analysis_response)),
+                                     json.loads(json_dumps(post.analysis_response, 'json')))
+                    response = SendAsyncResponse(200, encoded_data=encode(post.analysis_response), message='ok')
+                    self.assertEqual(json.loads(response.content),
+                                     json.loads(legacy_response(200, post.analysis_response, 'ok').content))
+
+    def test_encoded_response_cache_keeps_the_most_recent_entries(self):
+        encoded_cache = EncodedResponseCache(max_size=2)
+        encoded = []
+
+        def encode(key):
+            encoded.append(key)
+            return key.encode()
+
+        for key in ('a', 'b', 'a', 'c', 'a', 'b'):
+            self.assertEqual(encoded_cache.get_or_encode(key, lambda: encode(key)), key.encode())
+        self.assertEqual(encoded, ['a', 'b', 'c', 'b'])
@@ -1,8 +1,11 @@
 from django.urls import path
-from .views import get_post_analysis, create_post
+from .views import get_post_analysis, post_collection, readiness_check, service_metrics, corpus_stats
 
 app_name = 'post'
 
 urlpatterns = [
-    path('', create_post, name='post-create'),
+    path('', post_collection, name='post-create'),
+    path('ready', readiness_check, name='post-ready'),
+    path('metrics', service_metrics, name='post-metrics'),
+    path('stats', corpus_stats, name='post-stats'),
     path('<str:post_id>/analyze', get_post_analysis, name='post-analyziz'),]
@@ -0,0 +1,164 @@
+import uuid
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from utils.bloom import LocalScalableBloomFilter, RedisScalableBloomFilter
+from utils.metrics import metrics
+from .models import Post
+
+POST_UUID_FILTER_NAME = 'post_uuids'
+POST_UUID_FILTER_REBUILD_LOCK = 'post_uuid_filter_rebuild_lock'
+
+_post_uuid_filter = None
+_post_uuid_filter_lock = threading.Lock()
+
+
+def post_uuid_key(post_id) -> str:
+    """
+    Canonical form of a uuid, the filter must see the same string however the client wrote it.
+
+    :raises ValueError: If post_id is not a uuid.
+    """
+    return str(uuid.UUID(str(post_id)))
+
+
+def create_post_uuid_filter():
+    """
+    Return a Bloom filter of post uuids stored in Redis when the default
+    cache is django-redis, otherwise one local to this process.
+    """
+    try:
+        from django_redis import get_redis_connection
+        client = get_redis_connection('default')
+    except NotImplementedError:
+        return LocalScalableBloomFilter(settings.POST_UUID_FILTER_CAPACITY, settings.POST_UUID_FILTER_ERROR_RATE)
+    return RedisScalableBloomFilter(client, POST_UUID_FILTER_NAME,
+                                    settings.POST_UUID_FILTER_CAPACITY, settings.POST_UUID_FILTER_ERROR_RATE)
+
+
+def get_post_uuid_filter():
+    """
+    Return the post uuid filter, creating it on first use.
+
+    A filter that is not ready yet is loaded from the post table in a
+    background thread. The shared Redis filter is loaded by one process only,
+    normally it is built by the rebuild_post_uuid_filter command.
+    """
+    global _post_uuid_filter
+    if _post_uuid_filter is None:
+        with _post_uuid_filter_lock:
+            if _post_uuid_filter is None:
+                _post_uuid_filter = create_post_uuid_filter()
+                threading.Thread(target=ensure_post_uuid_filter_ready, args=(_post_uuid_filter,),
+                                 name='post-uuid-filter-load', daemon=True).start()
+    return _post_uuid_filter
+
+
+def ensure_post_uuid_filter_ready(bloom) -> None:
+    shared = isinstance(bloom, RedisScalableBloomFilter)
+    try:
+        if bloom.is_ready() or (shared and not cache.add(POST_UUID_FILTER_REBUILD_LOCK, 1, 60 * 60)):
+            return
+        try:
+            load_post_uuid_filter(bloom)
+        finally:
+            if shared:
+                cache.delete(POST_UUID_FILTER_REBUILD_LOCK)
+
+    except Exception as e:
+        logging.error(f'Unable to load the post uuid filter: {str(e)}')
+
+
+def load_post_uuid_filter(bloom, chunk_size: int = 10000) -> int:
+    """
+    Rebuild a post uuid filter from the post table.
+
+    Lookups fall through to the DB until the load is done. Posts created
+    meanwhile are added by the post_save signal, and the uuid column is
+    streamed after the filter is cleared. A post whose signal ran before the
+    clear but whose transaction committed after the stream read past it is
+    missed. A duplicate of it then skips the existence query, and the unique
+    constraint on uuid still rejects it.
+
+    :return: Number of uuids added.
+    """
+    bloom.clear()
+    added = 0
+    batch = []
+    for post_uuid in Post.objects.values_list('uuid', flat=True).order_by().iterator(chunk_size=chunk_size):
+        batch.append(str(post_uuid))
+        if len(batch) >= chunk_size:
+            bloom.add_many(batch)
+            added, batch = added + len(batch), []
+    bloom.add_many(batch)
+    bloom.mark_ready()
+    return added + len(batch)
+
+
+def add_post_uuid(post_id) -> None:
+    """
+    Add the uuid of a new post to the filter.
+
+    A failed add only means a duplicate of this post skips the existence
+    query, the unique constraint on uuid still rejects it.
+    """
+    if not settings.POST_UUID_FILTER:
+        return
+    try:
+        get_post_uuid_filter().add(post_uuid_key(post_id))
+    except Exception as e:
+        metrics.incr('post_uuid_filter.add_failed')
+        logging.error(f'Unable to add {post_id} to the post uuid filter: {str(e)}')
+
+
+def post_uuid_might_exist(post_id):
+    """
+    Check a uuid against the filter before querying the post table.
+
+    :return: False when no post with this uuid was ever created, the existence
+        query can be skipped. True when it probably exists. None when the
+        filter can not tell, it is disabled, not ready or unreachable.
+    """
+    if not settings.POST_UUID_FILTER:
+        return None
+    try:
+        found = get_post_uuid_filter().lookup(post_uuid_key(post_id))
+    except ValueError:
+        return None
+    except Exception as e:
+        logging.error(f'Unable to check {post_id} against the post uuid filter: {str(e)}')
+        found = None
+
+    if found is None:
+        metrics.incr('post_uuid_filter.unavailable')
+        return None
+    metrics.incr('post_uuid_filter.maybe_present' if found else 'post_uuid_filter.queries_saved')
+    return found
+
+
+def record_existence_check(exists: bool) -> None:
+    """
+    Record what the DB said about a uuid the filter reported as present.
+    """
+    metrics.incr('post_uuid_filter.true_positives' if exists else 'post_uuid_filter.false_positives')
+
+
+def post_uuid_filter_report() -> dict:
+    """
+    Queries saved by the filter in this process and its observed false
+    positive rate, the share of new uuids that still needed the existence query.
+    """
+    counters = metrics.snapshot()['counters']
+    saved = counters.get('post_uuid_filter.queries_saved', 0)
+    false_positives = counters.get('post_uuid_filter.false_positives', 0)
+    return {
+        'queries_saved': saved,
+        'false_positives': false_positives,
+        'true_positives': counters.get('post_uuid_filter.true_positives', 0),
+        'unavailable': counters.get('post_uuid_filter.unavailable', 0),
+        'observed_false_positive_rate': round(false_positives / (saved + false_positives), 6)
+        if saved + false_positives else None,
+    }
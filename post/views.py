@@ -1,10 +1,12 @@
 import logging
-import dask
 import json
-import dask.multiprocessing
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.cache import add_never_cache_headers
 
 from rest_framework import status
 from rest_framework.request import Request
@@ -14,21 +16,142 @@ from exceptions.service_error import ServiceException
 
 from .async_queries import (
     get_post_async,
+    get_stored_post_text_async,
     post_exists_async,
     post_create_async,
-    update_post_sync
+    list_posts_async,
+    corpus_stats_async,
+    save_post_analysis,
+    analysis_validators_function
 )
 
 from decorators.custom_cache import custom_cache_page
+from decorators.conditional import conditional_page
 from utils.response import SendAsyncResponse
-from utils.common import validate_analyzed_data_response
+from utils.metrics import metrics
+from utils.common import validate_analyzed_data_response, encode_cursor, decode_cursor
+from utils.compression import iter_stored_text, stored_text_length
 from utils.caching_functions import (
     analyze_post_cache_key_function,
-    create_post_cache_key_function
+    create_post_cache_key_function,
+    patch_analysis_validators,
+    get_cached_analysis_response,
+    mark_analysis_in_progress,
+    clear_analysis_in_progress
 )
 
-from .serializers import PostValidationSerializer
-from .core import divide_text, analyze_text, process_subtext_results
+from .models import Post
+from .serializers import PostValidationSerializer, PostListQuerySerializer
+from .core import divide_text_chunks
+from .uuid_filter import post_uuid_might_exist, record_existence_check, post_uuid_filter_report
+from .analysis_pool import analyze_text_parts_async, analysis_pool_status
+from .admission import get_admission_controller
+from .notifier import notify_analysis_written, wait_for_analysis
+
+
+async def post_collection(request, *args, **kwargs):
+    """
+    Dispatch the post collection route, GET lists posts and other methods go to create_post.
+    """
+    if request.method == 'GET':
+        return await list_posts(request, *args, **kwargs)
+    return await create_post(request, *args, **kwargs)
+
+
+async def list_posts(request: Request, *args: list, **kwargs: dict) -> dict:
+    """
+    List posts with their analysis, oldest first, using keyset pagination.
+
+    Pages are seeked by (created_at, id) from the cursor instead of an offset,
+    so every page costs the same however deep the cursor is.
+
+    :param request: The HTTP request object.
+    :param args: Additional positional arguments.
+    :param kwargs: Additional keyword arguments.
+    :return: Response containing one page of posts and the next cursor.
+
+    :query params:
+        cursor: next_cursor of the previous page.
+        limit: Page size, at most POST_LIST_MAX_PAGE_SIZE.
+        is_analysed: true or false.
+        analysed_after, analysed_before: ISO 8601 datetimes, only analysed posts match.
+    :response:{
+    "status": 200,
+    "data": {
+        "posts": [{
+            "uuid": "550e8400-e29b-41d4-a716-446655440000",
+            "created_at": "2023-08-20T10:00:00.000000Z",
+            "is_analysed": true,
+            "analysed_at": "2023-08-20T10:00:05.000000Z",
+            "analysis": {
+                "total_words": 5,
+                "average_word_length": 6
+            }
+        }],
+        "next_cursor": "WyIyMDIzLTA4LTIwVDEwOjAwOjAwKzAwOjAwIiwgMV0"
+    },
+    "message": "Fetched posts successfully",
+    "error_code": null
+    }
+    """
+    try:
+        serializer = PostListQuerySerializer(data=request.GET.dict())
+        if not serializer.is_valid():
+            raise ServiceException(
+                status.HTTP_400_BAD_REQUEST,
+                ErrorCodes.REQUEST_VALIDATION_FAILED, f'Invalid list parameters {serializer.errors}')
+
+        params = serializer.validated_data
+        limit = params['limit']
+
+        filters = dict()
+        if params['is_analysed'] is not None:
+            filters['is_analysed'] = params['is_analysed']
+        if 'analysed_after' in params:
+            filters.update(is_analysed=True, analysed_at__gte=params['analysed_after'])
+        if 'analysed_before' in params:
+            filters.update(is_analysed=True, analysed_at__lt=params['analysed_before'])
+
+        after = None
+        if params.get('cursor'):
+            try:
+                created_at, pk = decode_cursor(params['cursor'])
+                after = (parse_datetime(created_at), int(pk))
+                if after[0] is None:
+                    raise ValueError('Malformed cursor')
+            except (ValueError, TypeError):
+                raise ServiceException(
+                    status.HTTP_400_BAD_REQUEST, ErrorCodes.REQUEST_VALIDATION_FAILED, 'Invalid cursor')
+
+        rows = await list_posts_async(filters, after, limit + 1)
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1]['created_at'].isoformat(), rows[-1]['id']])
+
+        posts = [{
+            'uuid': row['uuid'],
+            'created_at': row['created_at'],
+            'is_analysed': row['is_analysed'],
+            'analysed_at': row['analysed_at'] if row['is_analysed'] else None,
+            'analysis': {
+                'total_words': row['total_words'],
+                'average_word_length': row['average_word_length']
+            }
+        } for row in rows]
+
+        return SendAsyncResponse(
+            status.HTTP_200_OK, dict(posts=posts, next_cursor=next_cursor), message='Fetched posts successfully')
+
+    except ServiceException as e:
+        return SendAsyncResponse(
+            e.status_code, None, error_code=e.error_code, message=e.message)
+
+    except Exception as e:
+        return SendAsyncResponse(
+            status.HTTP_500_INTERNAL_SERVER_ERROR, None,
+            error_code=500, message=str(e))
 
 
 @custom_cache_page(settings.CACHE_TTL, cache_key_func=create_post_cache_key_function, cache_status_codes=[409])
@@ -68,7 +191,16 @@ async def create_post(request, *args, **kwargs):
             valid_data = serializer.validated_data
 
             uuid = valid_data['uuid']
-            existing_post = await post_exists_async(uuid)
+            existing_post = None
+
+            # Nearly every uuid is new, a definite miss in the uuid filter
+            # skips the existence query. The unique constraint still guards
+            # the insert.
+            might_exist = await sync_to_async(post_uuid_might_exist)(uuid)
+            if might_exist is not False:
+                existing_post = await post_exists_async(uuid)
+                if might_exist:
+                    record_existence_check(existing_post is not None)
 
             if existing_post:
                 raise ServiceException(
@@ -96,6 +228,33 @@ async def create_post(request, *args, **kwargs):
             error_code=500, message=str(e))
 
 
+def parse_wait_seconds(wait: str) -> float:
+    """
+    Parse the wait query parameter of a long-poll request.
+
+    :return: Seconds to wait, capped at ANALYSIS_MAX_WAIT_SECONDS, 0 when absent.
+    :raises ServiceException: If wait is not a non negative number.
+    """
+    if not wait:
+        return 0
+    try:
+        seconds = float(wait)
+    except ValueError:
+        seconds = -1
+    if not 0 <= seconds < float('inf'):
+        raise ServiceException(status.HTTP_400_BAD_REQUEST,
+                               ErrorCodes.REQUEST_VALIDATION_FAILED, 'wait must be a number of seconds')
+    return min(seconds, settings.ANALYSIS_MAX_WAIT_SECONDS)
+
+
+def analysed_post_response(post: Post):
+    response = SendAsyncResponse(status.HTTP_200_OK, encoded_data=post.encoded_analysis_response,
+                                 message='Fetched analysis successfully')
+    patch_analysis_validators(response, post.uuid, post.analysed_at)
+    return response
+
+
+@conditional_page(validators_func=analysis_validators_function)
 @custom_cache_page(settings.CACHE_TTL, cache_key_func=analyze_post_cache_key_function)
 async def get_post_analysis(request: Request, post_id: str, *args: list, **kwargs: dict) -> dict:
     """
@@ -106,11 +265,16 @@ async def get_post_analysis(request: Request, post_id: str, *args: list, **kwarg
     :param args: Additional positional arguments.
     :param kwargs: Additional keyword arguments.
     :return: Response containing the analysis details.
+
+    :query params:
+        wait: Seconds, at most ANALYSIS_MAX_WAIT_SECONDS, to wait for an
+            analysis of the post another request is running instead of
+            analysing it again. Answers 202 if it is still running by then.
     :response:{
     "status": 200,
     "data": {
-        "post_id": "550e8400-e29b-41d4-a716-446655440000",
-        "is_analysed": false,
+        "uid": "550e8400-e29b-41d4-a716-446655440000",
+        "is_analysed": true,
         "analysis": {
                     'total_words': 5,
                     'average_word_length': 6
@@ -121,40 +285,146 @@ async def get_post_analysis(request: Request, post_id: str, *args: list, **kwarg
     }
     """
     try:
-        response_dict = dict()
+        wait = parse_wait_seconds(request.GET.get('wait'))
         post = await get_post_async(post_id)
 
         logging.error(f'{post.is_analysed}')
 
         if post.is_analysed:
-            return SendAsyncResponse(status.HTTP_200_OK,
-                                     post.analysis_response, message='Fetched analysis successfully')
+            return analysed_post_response(post)
+
+        if wait:
+            # Park until the running analysis is written, no DB connection is used meanwhile.
+            written = await wait_for_analysis(post_id, wait)
+            if written is False:
+                return SendAsyncResponse(status.HTTP_202_ACCEPTED, dict(is_analysed=False, uuid=post_id),
+                                         message='Analysis in progress')
+            if written:
+                response = await sync_to_async(get_cached_analysis_response)(post_id)
+                if response is not None:
+                    return response
+                post = await get_post_async(post_id)
+                if post.is_analysed:
+                    return analysed_post_response(post)
+
+        # The text is decompressed part by part as the analysis consumes it.
+        stored_text = await get_stored_post_text_async(post_id) or ''
+        text_length = stored_text_length(stored_text)
+        text_part_generator = divide_text_chunks(iter_stored_text(stored_text), text_length)
+
+        marked = await sync_to_async(mark_analysis_in_progress)(post_id)
+        try:
+            # Only cold analyses go through admission, cache hits and analysed
+            # posts have been answered above.
+            async with get_admission_controller().admit(text_length):
+                analyzed_data = await analyze_text_parts_async(text_part_generator)
+
+            logging.error(f'analyzed_data{analyzed_data}')
+            is_valid_analysis = validate_analyzed_data_response(analyzed_data)
+            if not is_valid_analysis:
+                raise ServiceException(status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                       ErrorCodes.RESPONSE_DATA_NOT_CORRECT, 'Unexpected analysis data')
+
+            # Rendered from the post like every later read, so the body
+            # behind the ETag is the same whichever path serves it.
+            post.is_analysed = True
+            post.analysed_at = timezone.now()
+            post.total_words = analyzed_data['total_words']
+            post.average_word_length = analyzed_data['average_word_length']
+            response = analysed_post_response(post)
+
+            await save_post_analysis(post_id, analyzed_data, response, post.analysed_at)
+
+        finally:
+            if marked:
+                # The one notification of this analysis, sent once the result is
+                # cached, or when it failed and the waiters retry it themselves.
+                await sync_to_async(clear_analysis_in_progress)(post_id)
+                await sync_to_async(notify_analysis_written)(post_id)
+
+        return response
+
+    except ValidationError:
+        raise ServiceException(status.HTTP_400_BAD_REQUEST,
+                               ErrorCodes.REQUEST_VALIDATION_FAILED, 'Not a valid post id')
 
-        text = post.post_description
-        text_part_generator = divide_text(text)
+    except ServiceException as e:
+        response = SendAsyncResponse(
+            e.status_code, None, error_code=e.error_code, message=e.message)
+        if e.rest_obj and 'retry_after' in e.rest_obj:
+            response['Retry-After'] = str(e.rest_obj['retry_after'])
+        return response
 
-        with dask.config.set(scheduler='processes'):
-            results_dask = dask.compute(
-                *[dask.delayed(analyze_text)(part) for _, part in enumerate(text_part_generator)])
+    except Exception as e:
+        return SendAsyncResponse(
+            status.HTTP_500_INTERNAL_SERVER_ERROR, None,
+            error_code=500, message=str(e))
 
-        analyzed_data = process_subtext_results(results_dask)
 
-        logging.error(f'analyzed_data{analyzed_data}')
-        is_valid_analysis = validate_analyzed_data_response(analyzed_data)
-        if not is_valid_analysis:
-            raise ServiceException(status.HTTP_500_INTERNAL_SERVER_ERROR,
-                                   ErrorCodes.RESPONSE_DATA_NOT_CORRECT, 'Unexpected analysis data')
+async def readiness_check(request: Request, *args: list, **kwargs: dict) -> dict:
+    """
+    Report whether this worker is warmed up and ready to take traffic.
 
-        response_dict.update(dict(is_analysed=True, uuid=post_id, analysis=analyzed_data))
+    :param request: The HTTP request object.
+    :param args: Additional positional arguments.
+    :param kwargs: Additional keyword arguments.
+    :return: 200 once the analysis pool is warm, or when pre-warming is
+        disabled, 503 while it is still warming up.
+    :response:{
+    "status": 200,
+    "data": {
+        "ready": true,
+        "analysis_pool": {
+            "warm": true,
+            "warming": false,
+            "workers": 4,
+            "warmup_seconds": 0.41
+        }
+    },
+    "message": "Ready",
+    "error_code": null
+    }
+    """
+    pool_status = analysis_pool_status()
+    ready = pool_status['warm'] or not settings.ANALYSIS_POOL_PREWARM
 
-        _ = await update_post_sync(post_id, analyzed_data)
+    if ready:
+        response = SendAsyncResponse(status.HTTP_200_OK,
+                                     dict(ready=True, analysis_pool=pool_status), message='Ready')
+    else:
+        response = SendAsyncResponse(status.HTTP_503_SERVICE_UNAVAILABLE,
+                                     dict(ready=False, analysis_pool=pool_status), message='Warming up')
+    add_never_cache_headers(response)
+    return response
 
-        return SendAsyncResponse(
-            status.HTTP_200_OK, response_dict, message='Fetched analysis successfully')
 
-    except ValidationError:
-        raise ServiceException(status.HTTP_400_BAD_REQUEST,
-                               ErrorCodes.REQUEST_VALIDATION_FAILED, 'Not a valid post id')
+async def corpus_stats(request: Request, *args: list, **kwargs: dict) -> dict:
+    """
+    Return corpus wide statistics.
+
+    The figures come from the incrementally maintained stats shards instead
+    of an aggregate over the post table, see post.stats.
+
+    :param request: The HTTP request object.
+    :param args: Additional positional arguments.
+    :param kwargs: Additional keyword arguments.
+    :return: Response containing the corpus statistics.
+    :response:{
+    "status": 200,
+    "data": {
+        "total_posts": 1200,
+        "analysed_posts": 1150,
+        "backlog": 50,
+        "total_words": 3400000,
+        "average_word_length": 4.71
+    },
+    "message": "Fetched corpus statistics successfully",
+    "error_code": null
+    }
+    """
+    try:
+        stats = await corpus_stats_async()
+        return SendAsyncResponse(status.HTTP_200_OK, stats, message='Fetched corpus statistics successfully')
 
     except ServiceException as e:
         return SendAsyncResponse(
@@ -164,3 +434,20 @@ async def get_post_analysis(request: Request, post_id: str, *args: list, **kwarg
         return SendAsyncResponse(
             status.HTTP_500_INTERNAL_SERVER_ERROR, None,
             error_code=500, message=str(e))
+
+
+async def service_metrics(request: Request, *args: list, **kwargs: dict) -> dict:
+    """
+    Return the in-process metrics of the worker serving the request.
+
+    :param request: The HTTP request object.
+    :param args: Additional positional arguments.
+    :param kwargs: Additional keyword arguments.
+    :return: Response containing counters, gauges and summaries, e.g. the
+        admission queue depth and rejections or write-behind batch sizes, and
+        the queries saved by the post uuid filter with its false positive rate.
+    """
+    data = dict(metrics.snapshot(), post_uuid_filter=post_uuid_filter_report())
+    response = SendAsyncResponse(status.HTTP_200_OK, data, message='Fetched metrics successfully')
+    add_never_cache_headers(response)
+    return response
@@ -0,0 +1,201 @@
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import (
+    OperationalError,
+    DatabaseError,
+    InternalError,
+    close_old_connections,
+    models,
+    transaction)
+from django.db.models import Case, Value, When
+
+from post_analyzer.db_router import pin_post_to_primary
+from utils.metrics import metrics
+from .models import Post
+from .stats import record_analyses
+
+
+class AnalysisWriteBehind:
+
+    """
+    Write-behind queue for analysis results.
+
+    Results are collected by a background thread and written in one
+    transaction every `batch_size` items or `flush_interval_ms` milliseconds,
+    whichever comes first, with a single CASE based UPDATE per batch.
+
+    Callers populate the analysis cache before enqueueing, so reads never
+    depend on a flush. A result that could not be written leaves the row with
+    is_analysed=False and the post is analysed again on a later cache miss.
+
+    Usage:
+        writer = get_write_behind()
+        writer.enqueue(post_id, analyzed_data, analysed_at)
+    """
+
+    def __init__(self, batch_size: int, flush_interval_ms: int,
+                 max_queue_size: int = 10000, max_retries: int = 3, base_retry_interval: float = 0.5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_retries = max_retries
+        self.base_retry_interval = base_retry_interval
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='analysis-write-behind', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, post_id: str, analyzed_data: dict, analysed_at) -> bool:
+        """
+        Queue an analysis result for writing.
+
+        :return: False when the queue is full or the writer is stopping, the
+            caller is then expected to write the result itself.
+        """
+        if self._stopping.is_set():
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait((str(post_id), analyzed_data, analysed_at))
+        except queue.Full:
+            metrics.incr('write_behind.rejected')
+            return False
+        metrics.gauge('write_behind.queue_depth', self._queue.qsize())
+        return True
+
+    def stop(self, timeout: float = 10) -> None:
+        """
+        Stop accepting results and flush everything still queued.
+
+        When the writer thread is still busy after timeout seconds it is left
+        to finish the queue on its own, as a daemon thread it may then be cut
+        short by the interpreter exit.
+        """
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+            if thread.is_alive():
+                # Flushing here as well could write batches twice or out of
+                # order, the thread keeps draining the queue until it is empty.
+                logging.error(f'write-behind still flushing after {timeout}s, {self._queue.qsize()} results queued')
+                return
+        # Flush what was queued while no thread was running.
+        self._flush_batch(self._drain(self._queue.qsize()))
+
+    def _drain(self, limit: int) -> list:
+        items = []
+        while len(items) < limit:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self) -> None:
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._flush_batch(batch)
+
+    def _flush_batch(self, batch: list) -> None:
+        if not batch:
+            return
+
+        # A post analysed twice in the same window is written once, last result wins.
+        latest = {post_id: (analyzed_data, analysed_at) for post_id, analyzed_data, analysed_at in batch}
+
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            try:
+                close_old_connections()
+                with transaction.atomic():
+                    updated = self.bulk_update_analysis(latest)
+                # The replicas only lag behind from the commit on, the pin set
+                # when the result was queued may have run out meanwhile.
+                pin_post_to_primary(*latest)
+
+                metrics.observe('write_behind.batch_size', len(latest))
+                metrics.observe('write_behind.flush_latency_ms', (time.monotonic() - started) * 1000)
+                metrics.incr('write_behind.flushed', updated)
+                metrics.gauge('write_behind.queue_depth', self._queue.qsize())
+                return
+
+            except (OperationalError, DatabaseError, InternalError) as e:
+                logging.error(f'write-behind flush of {len(latest)} posts failed: {str(e)} because of database issue')
+                time.sleep(self.base_retry_interval * (2 ** attempt))
+
+        metrics.incr('write_behind.dropped', len(latest))
+        logging.error(f'write-behind dropped analysis of {len(latest)} posts: {", ".join(latest)}')
+
+    @staticmethod
+    def bulk_update_analysis(latest: dict) -> int:
+        """
+        Write many analysis results with a single CASE based UPDATE and
+        account for them in the corpus statistics. Runs inside a transaction.
+
+        :param latest: Mapping of post uuid to (analyzed data, analysed_at).
+        :return: Number of rows updated.
+        """
+        def case(output_field, value_of):
+            return Case(
+                *[When(uuid=post_id, then=Value(value_of(item))) for post_id, item in latest.items()],
+                output_field=output_field)
+
+        previous = list(Post.objects.select_for_update().filter(uuid__in=list(latest)).values_list(
+            'uuid', 'is_analysed', 'total_words', 'average_word_length'))
+        updated = Post.objects.filter(uuid__in=list(latest)).update(
+            is_analysed=True,
+            analysed_at=case(models.DateTimeField(), lambda item: item[1]),
+            total_words=case(models.IntegerField(), lambda item: item[0]['total_words']),
+            average_word_length=case(models.FloatField(),
+                                     lambda item: item[0]['average_word_length']))
+        analysed = {uuid.UUID(post_id): item[0] for post_id, item in latest.items()}
+        record_analyses([row[1:] for row in previous], [analysed[row[0]] for row in previous])
+        return updated
+
+
+_write_behind = None
+_write_behind_lock = threading.Lock()
+
+
+def get_write_behind() -> AnalysisWriteBehind:
+    """
+    Return the process wide write-behind writer, creating it on first use.
+    """
+    global _write_behind
+    if _write_behind is None:
+        with _write_behind_lock:
+            if _write_behind is None:
+                _write_behind = AnalysisWriteBehind(
+                    settings.ANALYSIS_WRITE_BEHIND_BATCH_SIZE,
+                    settings.ANALYSIS_WRITE_BEHIND_FLUSH_MS,
+                    settings.ANALYSIS_WRITE_BEHIND_MAX_QUEUE)
+                atexit.register(_write_behind.stop)
+    return _write_behind
@@ -2,6 +2,7 @@
 ASGI config for post_analyzer project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with post_analyzer/gunicorn_conf.py to run several event loop workers.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -11,6 +12,10 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'post_analyzer.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'post_analyzer.settings.local')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from post_analyzer.lifespan import LifespanMiddleware  # noqa: E402
+
+application = LifespanMiddleware(django_application)
@@ -0,0 +1,18 @@
+"""
+Preload module of the dask workers analysing posts.
+
+Sets Django up in the worker so tasks can import project modules.
+Start remote workers from the project image with:
+
+    dask worker tcp://<scheduler>:8786 --preload post_analyzer.dask_preload
+"""
+import os
+
+import django
+
+
+def dask_setup(worker) -> None:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'post_analyzer.settings.local')
+    # Cluster workers only run tasks, they must not start an analysis pool of their own.
+    os.environ['ANALYSIS_POOL_PREWARM'] = '0'
+    django.setup()
@@ -0,0 +1,76 @@
+import random
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+PRIMARY_DATABASE = 'default'
+
+
+def replica_pin_cache_key(post_id: str) -> str:
+    return f'db_primary_pin_{str(post_id).lower()}'
+
+
+def pin_post_to_primary(*post_ids: str) -> None:
+    """
+    Send reads of posts to the primary for DATABASE_REPLICA_PIN_SECONDS.
+
+    Called after a post is created or updated so that the next reads see the
+    write even if the replicas are lagging behind (read-your-writes).
+    The pin lives in the shared cache so it holds across workers, pinning
+    again restarts it.
+
+    :param post_ids: The UUIDs of the posts.
+    """
+    if not settings.DATABASE_REPLICAS or not post_ids:
+        return
+    try:
+        cache.set_many({replica_pin_cache_key(post_id): True for post_id in post_ids},
+                       settings.DATABASE_REPLICA_PIN_SECONDS)
+    except Exception as e:
+        logging.error(f'Unable to pin {", ".join(map(str, post_ids))} to the primary database: {str(e)}')
+
+
+def read_database_for_post(post_id: str) -> str:
+    """
+    Choose the database alias to read a post from.
+
+    :param post_id: The UUID of the post.
+    :return: The primary alias when there are no replicas, the post was
+        written recently, or the pin cannot be checked, otherwise a replica.
+    """
+    if not settings.DATABASE_REPLICAS:
+        return PRIMARY_DATABASE
+    try:
+        if cache.get(replica_pin_cache_key(post_id)):
+            return PRIMARY_DATABASE
+    except Exception as e:
+        logging.error(f'Unable to check primary pin of {post_id}: {str(e)}')
+        return PRIMARY_DATABASE
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+class PrimaryReplicaRouter:
+
+    """
+    Database router sending writes to the primary and post reads to replicas.
+
+    Only models of the post app are read from DATABASE_REPLICAS; auth, admin
+    and session tables always use the primary. Per post read-your-writes
+    protection is applied by the queries through read_database_for_post.
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and model._meta.app_label == 'post':
+            return random.choice(settings.DATABASE_REPLICAS)
+        return PRIMARY_DATABASE
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY_DATABASE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True
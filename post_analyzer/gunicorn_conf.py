@@ -0,0 +1,34 @@
+"""
+Gunicorn config serving post_analyzer.asgi with uvicorn event loop workers.
+
+Usage:
+    gunicorn -c post_analyzer/gunicorn_conf.py post_analyzer.asgi:application
+
+Every value can be overridden through the environment, e.g. WEB_CONCURRENCY=4.
+On SIGTERM workers stop accepting connections and get GRACEFUL_TIMEOUT
+seconds to drain in-flight requests, see post_analyzer.lifespan.
+"""
+
+import os
+import multiprocessing
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+keepalive = int(os.environ.get('KEEP_ALIVE', 5))
+timeout = int(os.environ.get('WORKER_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 30))
+
+# Workers start and warm their analysis pool while booting, see post.apps.
+# Each one sizes its pool and its analysis admission limits by its share of
+# the host, so it needs to know how many workers run.
+raw_env = [
+    'ANALYSIS_POOL_PREWARM=' + os.environ.get('ANALYSIS_POOL_PREWARM', '1'),
+    f'WEB_CONCURRENCY={workers}',
+]
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
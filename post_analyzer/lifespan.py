@@ -0,0 +1,97 @@
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+
+def worker_startup() -> None:
+    """
+    Prepare a serving worker before it accepts requests.
+
+    Warms the analysis pool, unless PostConfig.ready() already does, starts
+    the write-behind writer and opens the cache connection, so the first
+    request does not pay for any of it.
+    """
+    from django.core.cache import cache
+    from post.analysis_pool import start_warming_analysis_pool
+    from post.write_behind import get_write_behind
+
+    start_warming_analysis_pool()
+    get_write_behind().start()
+    try:
+        cache.get('worker_startup')
+    except Exception as e:
+        logging.error(f'Cache is not reachable on worker startup: {str(e)}')
+
+
+def worker_shutdown() -> None:
+    """
+    Flush pending analysis writes and stop the analysis pool.
+    """
+    from post.analysis_pool import shutdown_analysis_pool
+    from post.write_behind import get_write_behind
+
+    get_write_behind().stop()
+    shutdown_analysis_pool(wait=True)
+
+
+class LifespanMiddleware:
+
+    """
+    ASGI middleware handling lifespan events in front of Django.
+
+    Django's ASGI handler only serves HTTP, this middleware answers the
+    server's lifespan startup and shutdown messages, runs the worker hooks and
+    on shutdown waits up to ASGI_DRAIN_TIMEOUT seconds for in-flight requests,
+    including running analyses, before tearing the worker down.
+
+    Example:
+        application = LifespanMiddleware(get_asgi_application())
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.in_flight = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        self.in_flight += 1
+        self.idle.clear()
+        try:
+            return await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self.idle.set()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await sync_to_async(worker_startup, thread_sensitive=False)()
+                except Exception as e:
+                    logging.error(f'Worker startup failed: {str(e)}')
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+
+            elif message['type'] == 'lifespan.shutdown':
+                await self.drain()
+                await sync_to_async(worker_shutdown, thread_sensitive=False)()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def drain(self) -> None:
+        """
+        Wait for in-flight requests to finish, at most ASGI_DRAIN_TIMEOUT seconds.
+        """
+        try:
+            await asyncio.wait_for(self.idle.wait(), settings.ASGI_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logging.error(f'Shutting down with {self.in_flight} requests still in flight')
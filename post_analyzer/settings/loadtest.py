@@ -0,0 +1,47 @@
+"""
+Self contained settings for `manage.py loadtest`, SQLite plus an in-memory
+cache standing in for Redis.
+
+Usage:
+    python manage.py migrate --settings post_analyzer.settings.loadtest
+    python manage.py loadtest --settings post_analyzer.settings.loadtest
+
+The cache lives inside each process, drive a server started with these
+settings with WEB_CONCURRENCY=1 or the cache hit ratio is meaningless.
+"""
+
+from .local import *  # noqa: F401,F403
+from .local import BASE_DIR
+
+DEBUG = False
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_loadtest.sqlite3',
+        'OPTIONS': {
+            # Request threads and the write-behind writer share one SQLite file.
+            'timeout': 30,
+        },
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'loadtest',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    }
+}
+
+# The views log every request at ERROR level, which would dominate the
+# measurements, only critical records are kept.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'root': {
+        'level': 'CRITICAL',
+    },
+}
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -62,10 +63,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django.middleware.cache.UpdateCacheMiddleware',
-    'django.middleware.cache.FetchFromCacheMiddleware',
 ]
 
+# Responses are cached per view by decorators.custom_cache.custom_cache_page,
+# analyses under versioned keys from utils.caching_functions. Do not add the
+# site wide cache middleware on top, it would cache them a second time.
+
 CACHE_TTL = 60 * 5
 
 MAX_PART_LENGTH = 300000
@@ -74,6 +77,79 @@ PARTS_SIZE_MARGIN = 2
 MIN_PART_LENGTH = 100000
 MAX_SUPPORTED_LENGTH = 3000000
 
+POST_LIST_PAGE_SIZE = 50
+POST_LIST_MAX_PAGE_SIZE = 500
+
+# Serving worker processes, set by post_analyzer/gunicorn_conf.py, 1 under runserver
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# Processes analysing text parts in each serving worker, defaults to an even
+# share of the CPUs so all workers together start one process per CPU
+ANALYSIS_POOL_WORKERS = int(os.environ.get('ANALYSIS_POOL_WORKERS') or max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY))
+
+# Where analyses run, 'processes' on the local analysis pool or 'distributed' on a dask cluster
+ANALYSIS_BACKEND = os.environ.get('ANALYSIS_BACKEND', 'processes')
+
+# Scheduler of the dask cluster, empty starts a LocalCluster in the process (development and tests)
+DASK_SCHEDULER_ADDRESS = os.environ.get('DASK_SCHEDULER_ADDRESS', '')
+DASK_MIN_WORKERS = int(os.environ.get('DASK_MIN_WORKERS', 1))
+DASK_MAX_WORKERS = int(os.environ.get('DASK_MAX_WORKERS', 4))
+DASK_CONNECT_TIMEOUT = 5
+DASK_RECONNECT_INTERVAL = 30
+DASK_ANALYSIS_TIMEOUT = 60
+
+# Start and warm the analysis pool from PostConfig.ready(), set by the ASGI server config
+ANALYSIS_POOL_PREWARM = os.environ.get('ANALYSIS_POOL_PREWARM') == '1'
+
+# Seconds warming waits for every analysis pool process to start
+ANALYSIS_POOL_WARMUP_TIMEOUT = 60
+
+# Seconds an ASGI worker waits for in-flight requests when shutting down
+ASGI_DRAIN_TIMEOUT = int(os.environ.get('ASGI_DRAIN_TIMEOUT', 25))
+
+# Admission control of analyses, see post.admission. The concurrency and memory
+# budget are for the whole host, each serving worker enforces its share of them
+ANALYSIS_MAX_CONCURRENCY = int(os.environ.get('ANALYSIS_MAX_CONCURRENCY', 4))
+ANALYSIS_MEMORY_BUDGET_BYTES = int(os.environ.get('ANALYSIS_MEMORY_BUDGET_BYTES', 512 * 1024 * 1024))
+ANALYSIS_MEMORY_PER_CHAR = 4
+ANALYSIS_MEMORY_PER_PART = 8 * 1024 * 1024
+ANALYSIS_QUEUE_SIZE = 32
+ANALYSIS_QUEUE_TIMEOUT = 10
+ANALYSIS_RETRY_AFTER = 5
+
+# Longest ?wait= of a long-poll analysis request, keep it below ASGI_DRAIN_TIMEOUT
+ANALYSIS_MAX_WAIT_SECONDS = 20
+
+# Seconds an analysis may run before long-poll requests stop waiting for it
+ANALYSIS_IN_PROGRESS_TTL = 120
+
+# Analysis results are written in batches by a background writer
+ANALYSIS_WRITE_BEHIND = True
+ANALYSIS_WRITE_BEHIND_BATCH_SIZE = 100
+ANALYSIS_WRITE_BEHIND_FLUSH_MS = 200
+ANALYSIS_WRITE_BEHIND_MAX_QUEUE = 10000
+
+# Rows the corpus statistics are spread over, see post.stats
+CORPUS_STATS_SHARDS = 8
+
+# Bloom filter of post uuids in front of the duplicate check of create_post, see post.uuid_filter
+POST_UUID_FILTER = True
+POST_UUID_FILTER_CAPACITY = 1000000
+POST_UUID_FILTER_ERROR_RATE = 0.001
+
+# Codec of stored post text, auto picks zstd when the zstandard package is
+# installed and zlib otherwise, lzma is smaller and slower, none disables it
+POST_TEXT_COMPRESSION = os.environ.get('POST_TEXT_COMPRESSION', 'auto')
+
+# Post texts shorter than this many bytes are stored uncompressed
+POST_TEXT_COMPRESSION_THRESHOLD = 1024
+
+# JSON encoder of the API responses, auto picks orjson when it is installed, see utils.response
+RESPONSE_JSON_BACKEND = os.environ.get('RESPONSE_JSON_BACKEND', 'auto')
+
+# Encoded analyses of analysed posts kept in memory by each worker
+ENCODED_RESPONSE_CACHE_SIZE = 10000
+
 ROOT_URLCONF = 'post_analyzer.urls'
 
 TEMPLATES = [
@@ -93,6 +169,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'post_analyzer.wsgi.application'
+ASGI_APPLICATION = 'post_analyzer.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -104,6 +181,14 @@ DATABASES = {
     }
 }
 
+DATABASE_ROUTERS = ['post_analyzer.db_router.PrimaryReplicaRouter']
+
+# Aliases from DATABASES serving post reads, empty sends every read to default
+DATABASE_REPLICAS = []
+
+# Reads of a post stay on default this long after it was written
+DATABASE_REPLICA_PIN_SECONDS = 5
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
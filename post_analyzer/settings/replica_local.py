@@ -0,0 +1,23 @@
+"""
+Local settings with a second SQLite database acting as a read replica.
+
+Usage:
+    python manage.py migrate --settings post_analyzer.settings.replica_local
+    python manage.py migrate --database replica --settings post_analyzer.settings.replica_local
+    python manage.py test --settings post_analyzer.settings.replica_local
+
+Nothing replicates between the two files, copy db.sqlite3 over
+db_replica.sqlite3 to simulate a caught up replica. In tests the replica is
+a separate empty database as well, so the router tests can tell which
+database a query went to. The other tests disable DATABASE_REPLICAS.
+"""
+
+from .local import *  # noqa: F401,F403
+from .local import BASE_DIR, DATABASES
+
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db_replica.sqlite3',
+}
+
+DATABASE_REPLICAS = ['replica']
@@ -1,16 +1,14 @@
 #!/bin/sh
 
-python manage.py makemigrations post --empty
-python manage.py makemigrations 
-python manage.py migrate 
+# Migrations are versioned in post/migrations, only apply them here.
+python manage.py migrate
 
 echo "from django.contrib.auth.models import User; User.objects.filter(username='admin').exists() or User.objects.create_superuser('admin', 'admin@admin.com', 'password1')" | python3 manage.py shell
 
-python manage.py runserver 0.0.0.0:8000
-
-
-
-
-
-
+# SERVER_MODE=asgi serves the async views on uvicorn event loop workers,
+# tune them with WEB_CONCURRENCY, KEEP_ALIVE and GRACEFUL_TIMEOUT.
+if [ "$SERVER_MODE" = "asgi" ]; then
+    exec gunicorn -c post_analyzer/gunicorn_conf.py post_analyzer.asgi:application
+fi
 
+python manage.py runserver 0.0.0.0:8000
@@ -0,0 +1,306 @@
+import math
+import hashlib
+import threading
+
+# Scalable Bloom filters (Almeida et al.): a filter is a list of layers, new
+# items go to the newest layer and once it holds `capacity` items a layer
+# `growth` times bigger with an error rate `tightening` times smaller is
+# added, so the overall false positive rate stays below
+# error_rate / (1 - tightening) however many items are added.
+
+
+def layer_parameters(capacity: int, error_rate: float) -> tuple:
+    """
+    :return: Tuple of (number of bits, number of hash functions) of a layer.
+    """
+    bits = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+    hashes = math.ceil(-math.log2(error_rate))
+    return bits, hashes
+
+
+def bloom_hashes(item: str) -> tuple:
+    """
+    Two 32 bit hashes of an item, combined as h1 + i * h2 into the positions
+    of the i-th hash function (Kirsch and Mitzenmacher).
+    """
+    digest = hashlib.blake2b(item.encode(), digest_size=8).digest()
+    return int.from_bytes(digest[:4], 'big'), int.from_bytes(digest[4:], 'big') | 1
+
+
+def estimated_false_positive_rate(layers: list) -> float:
+    """
+    :param layers: Tuples of (fraction of bits set, number of hash functions).
+    :return: Probability that an item never added is reported as present.
+    """
+    miss = 1.0
+    for fill_ratio, hashes in layers:
+        miss *= 1 - fill_ratio ** hashes
+    return 1 - miss
+
+
+class LocalScalableBloomFilter:
+
+    """
+    Scalable Bloom filter kept in process memory.
+
+    Usage:
+        bloom = LocalScalableBloomFilter(capacity=100000, error_rate=0.001)
+        bloom.add(item)
+        item in bloom
+    """
+
+    def __init__(self, capacity: int, error_rate: float, growth: int = 2, tightening: float = 0.5):
+        self.initial_capacity = capacity
+        self.initial_error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.ready = False
+            self.layers = []
+            self._add_layer(self.initial_capacity, self.initial_error_rate)
+
+    def is_ready(self) -> bool:
+        return self.ready
+
+    def mark_ready(self, ready: bool = True) -> None:
+        self.ready = ready
+
+    def _add_layer(self, capacity: int, error_rate: float) -> None:
+        bits, hashes = layer_parameters(capacity, error_rate)
+        self.layers.append({'bits': bits, 'hashes': hashes, 'capacity': capacity, 'error_rate': error_rate,
+                            'count': 0, 'bitmap': bytearray((bits + 7) // 8)})
+
+    def add(self, item: str) -> bool:
+        """
+        :return: True when a bit changed, i.e. the item was not present in the newest layer.
+        """
+        h1, h2 = bloom_hashes(item)
+        with self._lock:
+            layer = self.layers[-1]
+            added = False
+            for i in range(layer['hashes']):
+                position = (h1 + i * h2) % layer['bits']
+                byte, mask = position >> 3, 1 << (position & 7)
+                if not layer['bitmap'][byte] & mask:
+                    layer['bitmap'][byte] |= mask
+                    added = True
+            if added:
+                layer['count'] += 1
+                if layer['count'] >= layer['capacity']:
+                    self._add_layer(layer['capacity'] * self.growth, layer['error_rate'] * self.tightening)
+            return added
+
+    def add_many(self, items: list) -> None:
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        h1, h2 = bloom_hashes(item)
+        for layer in reversed(self.layers):
+            bitmap, bits = layer['bitmap'], layer['bits']
+            if all(bitmap[position >> 3] & (1 << (position & 7))
+                   for position in ((h1 + i * h2) % bits for i in range(layer['hashes']))):
+                return True
+        return False
+
+    def lookup(self, item: str):
+        """
+        :return: None while the filter is not ready, otherwise whether the item may be present.
+        """
+        return item in self if self.ready else None
+
+    def stats(self) -> dict:
+        layers = [dict(bits=layer['bits'], hashes=layer['hashes'], capacity=layer['capacity'], count=layer['count'],
+                       fill_ratio=sum(bin(byte).count('1') for byte in layer['bitmap']) / layer['bits'])
+                  for layer in self.layers]
+        return {
+            'backend': 'local',
+            'layers': layers,
+            'items': sum(layer['count'] for layer in layers),
+            'size_bytes': sum((layer['bits'] + 7) // 8 for layer in layers),
+            'estimated_false_positive_rate': estimated_false_positive_rate(
+                [(layer['fill_ratio'], layer['hashes']) for layer in layers]),
+        }
+
+
+# Layers are stored as "bits:hashes:capacity:error_rate" in a list, their
+# item counts in a hash and their bits in one bitmap per layer. Scaling
+# happens inside the add script, so concurrent writers can never add two
+# layers. Lua numbers are doubles, h1 + i * h2 stays exact below 2^53.
+#
+# Scripts may only touch the keys they are given, so callers pass the layer
+# list, the counts, the ready flag and the bitmap of every layer they know
+# of. Both scripts return {result, number of layers}, with KEYS_MISSING as
+# result when a writer added a layer the caller did not know of yet.
+
+KEYS_MISSING = -2
+
+REDIS_ADD_SCRIPT = """
+local h1, h2 = tonumber(ARGV[1]), tonumber(ARGV[2])
+if redis.call('LLEN', KEYS[1]) == 0 then
+    redis.call('RPUSH', KEYS[1], ARGV[3])
+end
+local layers = redis.call('LLEN', KEYS[1])
+if layers > #KEYS - 3 then
+    return {-2, layers}
+end
+local bits, hashes, capacity, error_rate = string.match(
+    redis.call('LINDEX', KEYS[1], layers - 1), '^(%d+):(%d+):(%d+):(.+)$')
+bits, hashes, capacity, error_rate = tonumber(bits), tonumber(hashes), tonumber(capacity), tonumber(error_rate)
+local added = 0
+for i = 0, hashes - 1 do
+    if redis.call('SETBIT', KEYS[3 + layers], (h1 + i * h2) % bits, 1) == 0 then
+        added = 1
+    end
+end
+if added == 1 and redis.call('HINCRBY', KEYS[2], layers - 1, 1) >= capacity then
+    local new_capacity = capacity * tonumber(ARGV[4])
+    local new_error_rate = error_rate * tonumber(ARGV[5])
+    local new_bits = math.ceil(-new_capacity * math.log(new_error_rate) / (math.log(2) ^ 2))
+    local new_hashes = math.ceil(-math.log(new_error_rate) / math.log(2))
+    layers = redis.call('RPUSH', KEYS[1], string.format('%d:%d:%d:%.17g', new_bits, new_hashes, new_capacity, new_error_rate))
+end
+return {added, layers}
+"""
+
+REDIS_CONTAINS_SCRIPT = """
+if ARGV[3] == '1' and redis.call('EXISTS', KEYS[3]) == 0 then
+    return {-1, 0}
+end
+local h1, h2 = tonumber(ARGV[1]), tonumber(ARGV[2])
+local layers = redis.call('LRANGE', KEYS[1], 0, -1)
+if #layers > #KEYS - 3 then
+    return {-2, #layers}
+end
+for index = #layers, 1, -1 do
+    local bits, hashes = string.match(layers[index], '^(%d+):(%d+):')
+    bits, hashes = tonumber(bits), tonumber(hashes)
+    local found = 1
+    for i = 0, hashes - 1 do
+        if redis.call('GETBIT', KEYS[3 + index], (h1 + i * h2) % bits) == 0 then
+            found = 0
+            break
+        end
+    end
+    if found == 1 then
+        return {1, #layers}
+    end
+end
+return {0, #layers}
+"""
+
+
+class RedisScalableBloomFilter:
+
+    """
+    Scalable Bloom filter stored in Redis bitmaps, shared by every process.
+
+    Each add or lookup is normally a single script call. All keys share the
+    `{name}` hash tag so they stay on one Redis Cluster slot, and the scripts
+    are given every key they touch.
+
+    Usage:
+        bloom = RedisScalableBloomFilter(get_redis_connection('default'), 'post_uuids', 100000, 0.001)
+        bloom.add(item)
+        item in bloom
+    """
+
+    def __init__(self, client, name: str, capacity: int, error_rate: float,
+                 growth: int = 2, tightening: float = 0.5):
+        self.client = client
+        self.growth = growth
+        self.tightening = tightening
+        self.layers_key = f'bloom:{{{name}}}:layers'
+        self.counts_key = f'bloom:{{{name}}}:counts'
+        self.bits_prefix = f'bloom:{{{name}}}:bits:'
+        self.ready_key = f'bloom:{{{name}}}:ready'
+        self.layer_count = 1
+        bits, hashes = layer_parameters(capacity, error_rate)
+        self.first_layer = f'{bits}:{hashes}:{capacity}:{error_rate!r}'
+        self._add = client.register_script(REDIS_ADD_SCRIPT)
+        self._contains = client.register_script(REDIS_CONTAINS_SCRIPT)
+
+    def script_keys(self) -> list:
+        return [self.layers_key, self.counts_key, self.ready_key] + [
+            f'{self.bits_prefix}{index}' for index in range(self.layer_count)]
+
+    def run_script(self, script, args: list) -> int:
+        """
+        Run a script with the keys of every known layer, again with more keys
+        while other processes added layers meanwhile.
+
+        :return: The result of the script.
+        """
+        while True:
+            result, layers = self.handle_reply(script(keys=self.script_keys(), args=args, client=self.client))
+            if result != KEYS_MISSING:
+                return result
+
+    def handle_reply(self, reply: list) -> tuple:
+        result, layers = (int(value) for value in reply)
+        self.layer_count = max(self.layer_count, layers)
+        return result, layers
+
+    def add_args(self, item: str) -> list:
+        h1, h2 = bloom_hashes(item)
+        return [h1, h2, self.first_layer, self.growth, self.tightening]
+
+    def add(self, item: str) -> bool:
+        return bool(self.run_script(self._add, self.add_args(item)))
+
+    def add_many(self, items: list) -> None:
+        pipeline = self.client.pipeline(transaction=False)
+        for item in items:
+            self._add(keys=self.script_keys(), args=self.add_args(item), client=pipeline)
+        for item, reply in zip(items, pipeline.execute()):
+            if self.handle_reply(reply)[0] == KEYS_MISSING:
+                # Added after a layer this batch did not know of.
+                self.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        h1, h2 = bloom_hashes(item)
+        return bool(self.run_script(self._contains, [h1, h2, 0]))
+
+    def lookup(self, item: str):
+        """
+        :return: None while the filter is not ready, otherwise whether the item may be present.
+        """
+        h1, h2 = bloom_hashes(item)
+        found = self.run_script(self._contains, [h1, h2, 1])
+        return None if found == -1 else bool(found)
+
+    def is_ready(self) -> bool:
+        return bool(self.client.exists(self.ready_key))
+
+    def mark_ready(self, ready: bool = True) -> None:
+        if ready:
+            self.client.set(self.ready_key, 1)
+        else:
+            self.client.delete(self.ready_key)
+
+    def clear(self) -> None:
+        layers = self.client.llen(self.layers_key)
+        self.client.delete(self.ready_key, self.layers_key, self.counts_key,
+                           *[f'{self.bits_prefix}{index}' for index in range(layers)])
+        self.layer_count = 1
+
+    def stats(self) -> dict:
+        counts = {int(index): int(count) for index, count in self.client.hgetall(self.counts_key).items()}
+        layers = []
+        for index, layer in enumerate(self.client.lrange(self.layers_key, 0, -1)):
+            bits, hashes, capacity, _ = layer.decode().split(':')
+            layers.append(dict(bits=int(bits), hashes=int(hashes), capacity=int(capacity),
+                               count=counts.get(index, 0),
+                               fill_ratio=self.client.bitcount(f'{self.bits_prefix}{index}') / int(bits)))
+        return {
+            'backend': 'redis',
+            'layers': layers,
+            'items': sum(layer['count'] for layer in layers),
+            'size_bytes': sum((layer['bits'] + 7) // 8 for layer in layers),
+            'estimated_false_positive_rate': estimated_false_positive_rate(
+                [(layer['fill_ratio'], layer['hashes']) for layer in layers]),
+        }
@@ -1,4 +1,10 @@
 import json
+import time
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_response_headers
+from django.utils.http import http_date
 from rest_framework.request import Request
 
 
@@ -16,6 +22,47 @@ def create_post_cache_key_function(request: Request, *args: list, **kwargs: dict
     return f'created_post_{uuid}'
 
 
+ANALYSIS_CACHE_VERSION_KEY = 'post_analysis_version'
+
+
+def analysis_cache_version() -> int:
+    """
+    Current generation of the analysis cache keys.
+
+    The version starts from the current timestamp, so if its key is ever
+    evicted the new version is still higher than every version used before
+    and stale entries can not be read again.
+
+    :return: The version number.
+    """
+    version = cache.get(ANALYSIS_CACHE_VERSION_KEY)
+    if version is None:
+        cache.add(ANALYSIS_CACHE_VERSION_KEY, int(time.time()), None)
+        version = cache.get(ANALYSIS_CACHE_VERSION_KEY)
+    return version
+
+
+def bump_analysis_cache_version() -> int:
+    """
+    Invalidate every cached analysis at once by moving to a new key version.
+
+    :return: The new version number.
+    """
+    analysis_cache_version()
+    try:
+        return cache.incr(ANALYSIS_CACHE_VERSION_KEY)
+    except ValueError:
+        # The key was evicted between the two calls.
+        cache.add(ANALYSIS_CACHE_VERSION_KEY, int(time.time()), None)
+        return cache.get(ANALYSIS_CACHE_VERSION_KEY)
+
+
+def analysis_cache_key(post_id: str, version: int = None) -> str:
+    if version is None:
+        version = analysis_cache_version()
+    return f'post_analysis_v{version}_{str(post_id).lower()}'
+
+
 def analyze_post_cache_key_function(request: Request, *args: list, **kwargs: dict) -> str:
     """
     Custom cache key function to generate cache key based on post_id.
@@ -25,4 +72,75 @@ def analyze_post_cache_key_function(request: Request, *args: list, **kwargs: dic
     :param kwargs: Additional keyword arguments.
     :return: The cache key string.
     """
-    return f'post_analysis_{kwargs.get("post_id")}'
+    return analysis_cache_key(kwargs.get("post_id"))
+
+
+def cache_analysis_response(post_id: str, response, timeout: int = settings.CACHE_TTL) -> None:
+    """
+    Store an analysis response under the same key custom_cache_page reads.
+
+    :param post_id: The unique identifier of the post.
+    :param response: The analysis response to cache.
+    :param timeout: The cache timeout in seconds.
+    """
+    patch_response_headers(response, timeout)
+    cache.set(analysis_cache_key(post_id), response, timeout)
+
+
+def invalidate_post_analysis(*post_ids: str) -> None:
+    """
+    Drop the cached analysis of the given posts.
+
+    :param post_ids: Unique identifiers of the posts.
+    """
+    if post_ids:
+        version = analysis_cache_version()
+        cache.delete_many([analysis_cache_key(post_id, version) for post_id in post_ids])
+
+
+def analysis_etag(post_id: str, analysed_at) -> str:
+    """
+    Strong ETag of an analysed post, it only changes when the post is analysed again.
+
+    :param post_id: The unique identifier of the post.
+    :param analysed_at: When the analysis was written.
+    :return: The quoted ETag.
+    """
+    digest = hashlib.sha1(f'{str(post_id).lower()}|{analysed_at.isoformat()}'.encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def patch_analysis_validators(response, post_id: str, analysed_at) -> None:
+    """
+    Add the ETag and Last-Modified headers of an analysed post to its response.
+    """
+    response['ETag'] = analysis_etag(post_id, analysed_at)
+    response['Last-Modified'] = http_date(analysed_at.timestamp())
+
+
+def analysis_in_progress_key(post_id: str) -> str:
+    return f'post_analysis_in_progress_{str(post_id).lower()}'
+
+
+def mark_analysis_in_progress(post_id: str) -> bool:
+    """
+    Flag a post as being analysed so long-poll requests wait for it.
+
+    :return: True when this caller set the flag, False when another request already holds it.
+    """
+    return cache.add(analysis_in_progress_key(post_id), True, settings.ANALYSIS_IN_PROGRESS_TTL)
+
+
+def clear_analysis_in_progress(post_id: str) -> None:
+    cache.delete(analysis_in_progress_key(post_id))
+
+
+def analysis_in_progress(post_id: str) -> bool:
+    return bool(cache.get(analysis_in_progress_key(post_id)))
+
+
+def get_cached_analysis_response(post_id: str):
+    """
+    :return: The cached analysis response of the post, or None.
+    """
+    return cache.get(analysis_cache_key(post_id))
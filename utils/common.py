@@ -1,3 +1,8 @@
+import json
+import base64
+import binascii
+
+
 def validate_analyzed_data_response(analyzed_data: dict) -> bool:
 
     """
@@ -7,3 +12,33 @@ def validate_analyzed_data_response(analyzed_data: dict) -> bool:
     """
 
     return all(value >= 1 for value in analyzed_data.values()) and isinstance(analyzed_data, dict)
+
+
+def encode_cursor(values: list) -> str:
+
+    """
+    encode keyset pagination values into an opaque url safe cursor
+    :params -> values, JSON serializable
+    :return -> cursor string
+    """
+
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> list:
+
+    """
+    decode a cursor produced by encode_cursor
+    :params -> cursor
+    :return -> list of values
+    :raises -> ValueError if the cursor is malformed
+    """
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f'Malformed cursor: {str(e)}')
+    if not isinstance(values, list):
+        raise ValueError('Malformed cursor')
+    return values
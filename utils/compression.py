@@ -0,0 +1,153 @@
+import lzma
+import zlib
+import codecs
+import struct
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Stored text is a 5 byte header, the codec id and the length of the text in
+# characters, followed by the UTF-8 encoded text as is or compressed. The
+# length lets readers size the text without decompressing it.
+
+HEADER = struct.Struct('>BI')
+
+RAW, ZLIB, LZMA, ZSTD = 0, 1, 2, 3
+CODECS = {'none': RAW, 'zlib': ZLIB, 'lzma': LZMA, 'zstd': ZSTD}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODECS.items()}
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def available_codecs() -> list:
+    return [name for name in CODECS if name != 'zstd' or zstandard is not None]
+
+
+def resolve_codec(codec: str) -> int:
+    """
+    :param codec: One of CODECS, or auto for zstd when the zstandard package is installed and zlib otherwise.
+    :return: Id of the codec.
+    :raises ValueError: If the codec is unknown or not installed.
+    """
+    if codec == 'auto':
+        return ZSTD if zstandard is not None else ZLIB
+    if codec not in CODECS:
+        raise ValueError(f'Unknown text codec {codec}, expected auto or one of {", ".join(CODECS)}')
+    if codec == 'zstd' and zstandard is None:
+        raise ValueError('The zstd text codec needs the zstandard package')
+    return CODECS[codec]
+
+
+def compress_text(text: str, codec: str = 'auto', threshold: int = 0, level: int = None) -> bytes:
+    """
+    Encode a text for storage.
+
+    :param text: Text to store.
+    :param codec: Codec name, see resolve_codec.
+    :param threshold: Texts of fewer UTF-8 bytes are stored uncompressed.
+    :param level: Compression level of the codec, its default when None.
+    :return: Header followed by the text, compressed unless that does not make it smaller.
+    """
+    data = text.encode()
+    codec_id = resolve_codec(codec)
+    if codec_id != RAW and len(data) >= threshold:
+        if codec_id == ZLIB:
+            compressed = zlib.compress(data, -1 if level is None else level)
+        elif codec_id == LZMA:
+            compressed = lzma.compress(data, preset=level)
+        else:
+            compressed = zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+        if len(compressed) < len(data):
+            return HEADER.pack(codec_id, len(text)) + compressed
+    return HEADER.pack(RAW, len(text)) + data
+
+
+def stored_text_length(stored) -> int:
+    """
+    :return: Number of characters of a stored text, read from its header.
+    """
+    if isinstance(stored, str):
+        return len(stored)
+    return HEADER.unpack_from(stored)[1]
+
+
+def stored_text_codec(stored) -> str:
+    if isinstance(stored, str):
+        return 'none'
+    return CODEC_NAMES[HEADER.unpack_from(stored)[0]]
+
+
+def iter_stored_bytes(stored, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Decompress a stored text incrementally.
+
+    :yield: The UTF-8 bytes of the text, at most about chunk_size at a time.
+    """
+    codec_id = HEADER.unpack_from(stored)[0]
+    payload = memoryview(stored)[HEADER.size:]
+
+    if codec_id == RAW:
+        for start in range(0, len(payload), chunk_size):
+            yield payload[start:start + chunk_size]
+
+    elif codec_id == ZLIB:
+        decompressor = zlib.decompressobj()
+        while payload and not decompressor.eof:
+            yield decompressor.decompress(payload, chunk_size)
+            payload = decompressor.unconsumed_tail
+        yield decompressor.flush()
+
+    elif codec_id == LZMA:
+        decompressor = lzma.LZMADecompressor()
+        yield decompressor.decompress(payload, chunk_size)
+        while not decompressor.eof and not decompressor.needs_input:
+            yield decompressor.decompress(b'', chunk_size)
+
+    elif codec_id == ZSTD:
+        if zstandard is None:
+            raise ValueError('Reading zstd compressed text needs the zstandard package')
+        yield from zstandard.ZstdDecompressor().read_to_iter(payload, write_size=chunk_size)
+
+    else:
+        raise ValueError(f'Unknown text codec id {codec_id}')
+
+
+def iter_stored_text(stored, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Decode a stored text chunk by chunk, so the whole text is never held in memory at once.
+
+    :param stored: Value returned by compress_text, or a plain str stored before compression.
+    :yield: Consecutive pieces of the text.
+    """
+    if isinstance(stored, str):
+        if stored:
+            yield stored
+        return
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for data in iter_stored_bytes(stored, chunk_size):
+        text = decoder.decode(data)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def decompress_text(stored) -> str:
+    """
+    :return: The whole text of a value returned by compress_text.
+    """
+    if isinstance(stored, str):
+        return stored
+    codec_id = HEADER.unpack_from(stored)[0]
+    payload = memoryview(stored)[HEADER.size:]
+    if codec_id == RAW:
+        return str(payload, 'utf-8')
+    if codec_id == ZLIB:
+        return zlib.decompress(payload).decode()
+    if codec_id == LZMA:
+        return lzma.decompress(payload).decode()
+    return b''.join(iter_stored_bytes(stored)).decode()
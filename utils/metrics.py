@@ -0,0 +1,65 @@
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+
+    """
+    A thread-safe, in-process registry of counters, gauges and summaries.
+
+    Counters only go up, gauges hold the last reported value and summaries
+    keep count, sum, min and max of observed values.
+
+    Example:
+        metrics.incr('write_behind.flushed', 10)
+        metrics.observe('write_behind.flush_latency_ms', 3.2)
+        metrics.snapshot()
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._gauges = dict()
+        self._summaries = dict()
+
+    def incr(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                self._summaries[name] = {'count': 1, 'sum': value, 'min': value, 'max': value}
+                return
+            summary['count'] += 1
+            summary['sum'] += value
+            summary['min'] = min(summary['min'], value)
+            summary['max'] = max(summary['max'], value)
+
+    def snapshot(self) -> dict:
+        """
+        Return a copy of all metrics, summaries include their average.
+        """
+        with self._lock:
+            summaries = {
+                name: dict(summary, avg=round(summary['sum'] / summary['count'], 3))
+                for name, summary in self._summaries.items()}
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'summaries': summaries
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+
+
+metrics = Metrics()
@@ -1,7 +1,23 @@
+import json
+import math
 import time
+import uuid
+import threading
+from collections import OrderedDict
 from datetime import date, datetime
 from decimal import Decimal
-from django.http import JsonResponse
+from json.encoder import encode_basestring_ascii
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+from utils.metrics import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 class ResponseSerializer:
@@ -68,12 +84,197 @@ class ResponseSerializer:
         return obj
 
 
-class SendAsyncResponse(JsonResponse):
+_django_json_encoder = DjangoJSONEncoder()
+
+
+def json_default(obj):
+    """
+    Encode the types the JSON backends do not know, the same way ResponseSerializer does.
+
+    :raises TypeError: If the object can not be encoded.
+    """
+    if isinstance(obj, datetime):
+        # The text of json_serial without the slow strftime, the first 26
+        # characters of isoformat leave out the UTC offset like it does.
+        return obj.isoformat(timespec='microseconds')[:26] + 'Z'
+    if isinstance(obj, (date, Decimal, time.struct_time, set)):
+        return ResponseSerializer.json_serial(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    # JsonResponse encoded whatever json_serial passed through, times of
+    # day, durations, uuids and lazy strings among them.
+    return _django_json_encoder.default(obj)
+
+
+def json_backend() -> str:
+    """
+    :return: The JSON backend of RESPONSE_JSON_BACKEND, auto picks orjson when it is installed.
+    """
+    backend = getattr(settings, 'RESPONSE_JSON_BACKEND', 'auto')
+    if backend == 'auto':
+        return 'orjson' if orjson is not None else 'json'
+    if backend == 'orjson' and orjson is None:
+        raise ValueError('The orjson JSON backend needs the orjson package')
+    return backend
+
+
+_json_encoder = json.JSONEncoder(default=json_default, separators=(',', ':'))
+
+
+def json_dumps(data, backend: str = None) -> bytes:
+    """
+    Encode data as compact JSON, dates and the other types of json_default included.
+    """
+    if (backend or json_backend()) == 'orjson':
+        # Datetimes go through json_default so they keep the format of ResponseSerializer.
+        return orjson.dumps(data, default=json_default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+    return _json_encoder.encode(data).encode()
+
+
+# Field types of response schemas, each one encodes a value of its type to
+# JSON bytes. A schema maps keys to field types or to nested schemas.
+
+def encode_integer(value) -> bytes:
+    return b'%d' % value
+
+
+def encode_number(value) -> bytes:
+    value = float(value)
+    return float.__repr__(value).encode() if math.isfinite(value) else json_dumps(value, 'json')
+
+
+def encode_boolean(value) -> bytes:
+    return b'true' if value else b'false'
+
+
+def encode_string(value) -> bytes:
+    return encode_basestring_ascii(str(value)).encode()
+
+
+def encode_datetime(value) -> bytes:
+    return encode_string(json_default(value))
+
+
+def encode_any(value) -> bytes:
+    return json_dumps(value, 'json')
+
+
+INTEGER, NUMBER, BOOLEAN, STRING, UUID, DATETIME, ANY = (
+    encode_integer, encode_number, encode_boolean, encode_string, encode_string, encode_datetime, encode_any)
+
+
+def compile_encoder(schema: dict, backend: str = None):
+    """
+    Compile the JSON encoder of one response shape.
+
+    With the json backend the keys are encoded once here, and encoding a value
+    only splices its fields, encoded by their type, between them. orjson
+    already encodes a dict faster than any Python code could, so its
+    encoder is a plain call.
+
+    Usage:
+        encode = compile_encoder({'uuid': UUID, 'analysis': {'total_words': INTEGER}})
+        encode({'uuid': post.uuid, 'analysis': {'total_words': 3}})
+
+    :param schema: Mapping of each key of the shape to its field type or to a nested schema.
+    :param backend: JSON backend, see json_backend.
+    :return: Function encoding a dict of that shape to JSON bytes.
+    """
+    if (backend or json_backend()) == 'orjson':
+        return lambda value: json_dumps(value, 'orjson')
+
+    fields = []
+    for index, (key, field) in enumerate(schema.items()):
+        encode_field = compile_encoder(field, 'json') if isinstance(field, dict) else field
+        fields.append(((b',' if index else b'{') + encode_string(key) + b':', key, encode_field))
+
+    def encode(value: dict) -> bytes:
+        pieces = []
+        for prefix, key, encode_field in fields:
+            field_value = value[key]
+            pieces.append(prefix)
+            pieces.append(b'null' if field_value is None else encode_field(field_value))
+        pieces.append(b'}')
+        return b''.join(pieces)
+
+    return encode
+
+
+def encode_envelope(status: int, data: bytes, message: str = "", error_code=None) -> bytes:
+    """
+    Encode the envelope every response shares around already encoded data.
+    """
+    return b'{"status":%d,"data":%b,"message":%b,"error_code":%b}' % (
+        status, data, encode_string(message) if isinstance(message, str) else encode_any(message),
+        b'null' if error_code is None else encode_any(error_code))
+
+
+class EncodedResponseCache:
+
+    """
+    Least recently used cache of encoded response data in process memory.
+
+    Only for data that never changes under its key, e.g. the analysis of a
+    post keyed by its analysed_at.
+
+    Usage:
+        cache = EncodedResponseCache(max_size=10000)
+        data = cache.get_or_encode(('analysis', post.uuid, post.analysed_at), encode)
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_encode(self, key, encode) -> bytes:
+        """
+        :param encode: Function without arguments returning the encoded data on a miss.
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+        if data is not None:
+            metrics.incr('encoded_response_cache.hit')
+            return data
+
+        metrics.incr('encoded_response_cache.miss')
+        data = encode()
+        if self.max_size > 0:
+            with self._lock:
+                self._entries[key] = data
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return data
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_encoded_response_cache = None
+_encoded_response_cache_lock = threading.Lock()
+
+
+def get_encoded_response_cache() -> EncodedResponseCache:
+    global _encoded_response_cache
+    if _encoded_response_cache is None:
+        with _encoded_response_cache_lock:
+            if _encoded_response_cache is None:
+                _encoded_response_cache = EncodedResponseCache(settings.ENCODED_RESPONSE_CACHE_SIZE)
+    return _encoded_response_cache
+
+
+class SendAsyncResponse(HttpResponse):
     """
     Custom JSON response class with serialized data.
 
-    This class extends Django's JsonResponse and provides a way to create JSON responses
-    with serialized data using the ResponseSerializer.
+    The data is encoded by json_dumps, or passed already encoded, and spliced
+    into the envelope by encode_envelope.
 
     Args:
         status (int): The HTTP status code for the response.
@@ -81,19 +282,19 @@ class SendAsyncResponse(JsonResponse):
         message (str, optional): A message to include in the response. Defaults to an empty string.
         error_code (int, optional): An error code to include in the response. Defaults to None.
         content_type (str, optional): The content type of the response. Defaults to "application/json".
+        encoded_data (bytes, optional): The data already encoded as JSON, replaces data.
 
     Usage:
         Use this class to create JSON responses with serialized data and optional details.
 
     Example:
         response = SendAsyncResponse(status=200, data=my_data, message="Success")
+        response = SendAsyncResponse(status=200, encoded_data=post.encoded_analysis_response)
 
     """
-    def __init__(self, status, data=None, message="", error_code=None, content_type="application/json"):
-        response_data = {
-            "status": status,
-            "data": ResponseSerializer.serialize(data),
-            "message": message,
-            "error_code": error_code
-        }
-        super().__init__(data=response_data, status=status, content_type=content_type)
+    def __init__(self, status, data=None, message="", error_code=None, content_type="application/json",
+                 encoded_data=None):
+        if encoded_data is None:
+            encoded_data = b'null' if data is None else json_dumps(data)
+        super().__init__(content=encode_envelope(status, encoded_data, message, error_code),
+                         status=status, content_type=content_type)